@@ -0,0 +1,215 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import vscii
+
+SIZES: list = [(80, 24), (160, 48), (240, 72), (320, 96), (400, 120)]
+HISTORY: list = [100, 1000, 10000]
+TREE_SIZES: list = [10, 100, 1000]
+
+class StubBackend(vscii.Backend):
+    """ Stands in for the terminal, counting what would have been sent to it.
+    """
+    width: int
+    height: int
+    cells: int = 0
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+
+    def get_size(self) -> tuple:
+        return (self.height, self.width)
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        self.cells += len(text)
+
+    def getch(self) -> int:
+        raise EOFError("The benchmark backend has no input.")
+
+    def poll_key(self) -> int:
+        return -1
+
+def measure(func, repeat: int) -> dict:
+    """ Time `func` over `repeat` runs, and measure the peak memory allocated
+    by a separate run.
+    """
+    func()
+    times: list = list()
+    for i in range(repeat):
+        start: float = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": statistics.median(times), "best": min(times), "peak_bytes": peak}
+
+def build_panels(framebuffer: vscii.FrameBuffer, columns: int, rows: int) -> list:
+    """ Fill the screen with a grid of text displays, nested in every kind of
+    container.
+    """
+    vsplit = vscii.VSplit()
+    displays: list = list()
+    for i in range(columns):
+        hsplit = vscii.HSplit()
+        vsplit.add_child(hsplit)
+        for j in range(rows):
+            display = vscii.TextDisplay()
+            display.print(f"Panel {i}, {j}\n" + "Some words to wrap around. " * 8)
+            displays.append(display)
+            if j == 0:
+                # Give the first row a fixed size box so `Center` is covered.
+                center = vscii.Center()
+                display.width = 20
+                display.height = 5
+                center.add_child(display)
+                hsplit.add_child(center)
+            else:
+                hsplit.add_child(display)
+    fullscreen = vscii.FullScreen()
+    fullscreen.add_child(vsplit)
+    framebuffer.add_elem(fullscreen)
+    return displays
+
+def build_tree(count: int) -> dict:
+    """ Build a `read_tree()` description with roughly `count` leaves.
+    """
+    tree: dict = dict()
+    for i in range(max(count // 10, 1)):
+        tree[f"split{i}"] = (vscii.HSplit(), {
+            f"display{i}_{j}": vscii.TextDisplay() for j in range(10)
+        })
+    return {"root": (vscii.FullScreen(), {"vsplit": (vscii.VSplit(), tree)})}
+
+def bench_size(width: int, height: int, repeat: int) -> list:
+    results: list = list()
+    size: str = f"{width}x{height}"
+    framebuffer = vscii.FrameBuffer(StubBackend(width, height))
+
+    art: str = vscii.create_rect("#", width // 2, height // 2)
+    sprite = vscii.Sprite(art)
+    results.append({"name": "blit_string", "size": size,
+        **measure(lambda: framebuffer.blit(art, width // 4, height // 4), repeat)})
+    results.append({"name": "blit_sprite", "size": size,
+        **measure(lambda: framebuffer.blit(sprite, width // 4, height // 4), repeat)})
+    results.append({"name": "fill_rect", "size": size,
+        **measure(lambda: framebuffer.fill_rect("#", width // 4, height // 4,
+            width // 2, height // 2), repeat)})
+
+    displays: list = build_panels(framebuffer, 4, 3)
+
+    def full_frame():
+        framebuffer.volatile = True
+        framebuffer._front = None
+        framebuffer.render()
+
+    def idle_frame():
+        framebuffer.volatile = False
+        framebuffer.render()
+
+    def changed_frame():
+        framebuffer.volatile = False
+        displays[0].print("Another line of text.\n")
+        framebuffer.render()
+
+    results.append({"name": "render_full", "size": size, **measure(full_frame, repeat)})
+    results.append({"name": "render_idle", "size": size, **measure(idle_frame, repeat)})
+    results.append({"name": "render_changed", "size": size, **measure(changed_frame, repeat)})
+
+    def layout():
+        framebuffer.invalidate_layout()
+        framebuffer.layout()
+
+    results.append({"name": "layout", "size": size, **measure(layout, repeat)})
+    results.append({"name": "layout_cached", "size": size,
+        **measure(framebuffer.layout, repeat)})
+
+    for history in HISTORY:
+        display = vscii.TextDisplay(history=history)
+        display.width = width
+        display.height = height - 1
+        for i in range(history):
+            display.print(f"Log line {i} with a few words to wrap around the display.\n")
+        target = vscii.Surface(width, height)
+        results.append({"name": "text_render", "size": size, "param": history,
+            **measure(lambda: display._render(target), repeat)})
+
+        def rewrap():
+            display.width -= 1
+            display._render(target)
+            display.width += 1
+            display._render(target)
+
+        results.append({"name": "text_rewrap", "size": size, "param": history,
+            **measure(rewrap, max(repeat // 10, 1))})
+    return results
+
+def bench_read_tree(repeat: int) -> list:
+    return [{"name": "read_tree", "param": count,
+        **measure(lambda: vscii.read_tree(build_tree(count)), repeat)}
+        for count in TREE_SIZES]
+
+def compare(results: list, baseline: dict, threshold: float) -> bool:
+    """ Print how each result changed from `baseline`, returning False if any
+    got slower, or allocated more memory, by more than `threshold`.
+    """
+    key = lambda result: (result["name"], result.get("size"), result.get("param"))
+    previous: dict = {key(result): result for result in baseline["results"]}
+    passed: bool = True
+    for result in results:
+        old: dict = previous.get(key(result))
+        if old is None:
+            continue
+        ratio: float = result["seconds"] / old["seconds"] if old["seconds"] else 1
+        memory: float = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1
+        slower: bool = ratio > 1 + threshold
+        larger: bool = memory > 1 + threshold
+        passed = passed and not (slower or larger)
+        status: str = "SLOWER" if slower else "LARGER" if larger else "ok"
+        print(f"{status:6} {ratio:6.2f}x {memory:6.2f}x mem  "
+            + " ".join(str(part) for part in key(result) if part is not None))
+    return passed
+
+def __main__():
+    parser = argparse.ArgumentParser(description="Benchmark VSCII without a terminal.")
+    parser.add_argument("--out", default="bench_results.json",
+        help="where to save the results as JSON")
+    parser.add_argument("--repeat", type=int, default=50,
+        help="number of timed runs per benchmark")
+    parser.add_argument("--compare", help="a previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+        help="how much slower, or how much more memory, a benchmark may take "
+        "before --compare fails")
+    args = parser.parse_args()
+
+    results: list = list()
+    for width, height in SIZES:
+        print(f"Running {width}x{height}...", file=sys.stderr)
+        results += bench_size(width, height, args.repeat)
+    results += bench_read_tree(args.repeat)
+
+    with open(args.out, "w") as file:
+        json.dump({
+            "python": platform.python_version(),
+            "time": time.time(),
+            "results": results,
+        }, file, indent=1)
+
+    for result in results:
+        print(f"{result['seconds'] * 1000:10.3f}ms {result['peak_bytes']:10}B  "
+            + " ".join(str(result[part]) for part in ("name", "size", "param") if part in result))
+
+    if args.compare:
+        with open(args.compare) as file:
+            if not compare(results, json.load(file), args.threshold):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    __main__()
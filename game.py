@@ -13,29 +13,22 @@ class Entity(object):
 class Player(Entity):
     pass
 
-framebuffer: vscii.FrameBuffer
-nodes: dict = {}
-player = Player()
-enemy: Entity = None
-
 class Item(object):
     name: str = ""
 
     def __init__(self, name = ""):
         self.name = name
 
-    def use(self):
-        nodes["player_console"].print(f"{self.name} cannot be used right now.\n")
+    def use(self, session: "GameSession"):
+        session.print(f"{self.name} cannot be used right now.\n")
 
 class Weapon(Item):
-    def use(self):
-        global enemy
-
-        if not enemy is None:
-            nodes["player_console"].print(f"You strike the {enemy.name} with your {self.name}.\n")
-            enemy = None
+    def use(self, session: "GameSession"):
+        if not session.enemy is None:
+            session.print(f"You strike the {session.enemy.name} with your {self.name}.\n")
+            session.enemy = None
         else:
-            nodes["player_console"].print(f"You swing the {self.name} in the air.\n")
+            session.print(f"You swing the {self.name} in the air.\n")
 
 class Heal(Item):
     magnitude: int
@@ -44,15 +37,24 @@ class Heal(Item):
         self.name = name
         self.magnitude = magnitude
 
-    def use(self):
-        global player
-
+    def use(self, session: "GameSession"):
+        player: Player = session.player
         value = self.magnitude if player.health + self.magnitude < player.max_health else player.max_health - player.health
         player.health += value
-        nodes["player_console"].print(f"You consumed the {self.name} and healed {value} points of health.\n")
-        nodes["inventory"].items.remove(self)
+        session.print(f"You consumed the {self.name} and healed {value} points of health.\n")
+        session.nodes["inventory"].items.remove(self)
+        session.nodes["inventory"].mark_dirty()
+        session.nodes["player_menu"].mark_dirty()
+
+def draw_frame(elem: vscii.FBElement, parent: vscii.FrameBuffer):
+    """ Draw the side and bottom edges shared by the menu panels.
+    """
+    parent.vline("|", elem.anch_x, elem.anch_y, elem.height)
+    parent.vline("|", elem.anch_x + elem.width - 1, elem.anch_y, elem.height)
+    parent.hline("_", elem.anch_x + 1, elem.anch_y + elem.height - 1, elem.width - 2)
 
 class InventoryMenu(vscii.FBElement):
+    cached = True
     items: list
 
     def __init__(self):
@@ -62,9 +64,7 @@ class InventoryMenu(vscii.FBElement):
         title: str = "Inventory"
 
         # Decorate.
-        parent.blit(vscii.create_rect("|", 1, self.height), self.anch_x, self.anch_y)
-        parent.blit(vscii.create_rect("|", 1, self.height), self.anch_x + self.width - 1, self.anch_y)
-        parent.blit(vscii.create_rect("_", self.width - 2, 1), self.anch_x + 1, self.anch_y + self.height - 1)
+        draw_frame(self, parent)
 
         # Draw title text.
         parent.blit(title, self.anch_x + (self.width - len(title)) // 2, self.anch_y + 1)
@@ -80,13 +80,17 @@ class InventoryMenu(vscii.FBElement):
         return None
 
 class PlayerMenu(vscii.FBElement):
+    cached = True
+    player: Player
+
+    def __init__(self, player: Player):
+        self.player = player
+
     def _render(self, parent):
-        global player
+        player: Player = self.player
 
         # Decorate.
-        parent.blit(vscii.create_rect("|", 1, self.height), self.anch_x, self.anch_y)
-        parent.blit(vscii.create_rect("|", 1, self.height), self.anch_x + self.width - 1, self.anch_y)
-        parent.blit(vscii.create_rect("_", self.width - 2, 1), self.anch_x + 1, self.anch_y + self.height - 1)
+        draw_frame(self, parent)
 
         # Draw player name
         parent.blit(player.name, self.anch_x + (self.width - len(player.name)) // 2, self.anch_y + 1)
@@ -96,107 +100,134 @@ class PlayerMenu(vscii.FBElement):
             self.anch_x + 4, self.anch_y + 3)
 
 class Environment(vscii.FBElement):
+    cached = True
+
     def _render(self, parent: vscii.FrameBuffer):
-        parent.blit(vscii.create_rect("#", self.width, self.height - 1), self.anch_x, self.anch_y)
-        parent.blit(vscii.create_rect("_", self.width, 1), self.anch_x, self.anch_y + self.height - 1)
+        parent.fill_rect("#", self.anch_x, self.anch_y, self.width, self.height - 1)
+        parent.hline("_", self.anch_x, self.anch_y + self.height - 1, self.width)
 
 class PlayerConsole(vscii.TextDisplay):
     def _render(self, parent: vscii.FrameBuffer):
-        result: str = ""
-        for i in self.buffer.splitlines():
-            x_off = 0
-            for i in i.split():
-                if x_off + len(i) > self.width - 2 - self.margin:
-                    result += "\n"
-                    x_off = 0
-                result += i + " "
-                x_off += len(i) + 1
-            result += "\n"
-        self.buffer = result
-        while len(self.buffer.splitlines()) >= self.height - 2:
-            self.buffer = self.buffer[self.buffer.find("\n") + 1:]
-
-        parent.blit(result, self.anch_x, self.anch_y)
+        # Leave the bottom rows free for the input line.
+        self._draw_rows(parent, self.visible_rows(self.width - 2 - self.margin,
+            self.height - 3), self.anch_x, self.anch_y, self.anch_x, self.width)
 
     def input(self, parent: vscii.FrameBuffer) -> str:
         return parent.input(self.get_left(), self.get_bottom() - 1, self.width)
 
 
-def select_item() -> Item:
-    return nodes["inventory"].items[vscii.SelectList.input(framebuffer,
-        nodes["inventory"].get_left() + 2,
-        nodes["inventory"].get_top() + 2,
-        len(nodes["inventory"].items), "→"
-    )]
-
-def game():
-    global enemy
-    global framebuffer
-    global nodes
-
-    # Create a framebuffer.
-    framebuffer = vscii.FrameBuffer()
-    # Make the framebuffer volatile so that it redraws each frame.
-    framebuffer.volatile = True
-
-    # Construct this screen's tree.
-    nodes = vscii.read_tree({
-        "screen" : (vscii.FullScreen(), {
-            "vsplit" : (vscii.VSplit(), {
-                "lefthsplit" : (vscii.HSplit(), {
-                    "environment" : Environment(),
-                    "player_console" : PlayerConsole(),
-                }),
-                "righthsplit" : (vscii.HSplit(), {
-                    "inventory" : InventoryMenu(),
-                    "player_menu" : PlayerMenu(),
-                }),
+class GameSession(object):
+    """ One game, from asking the player's name until they exit.\n
+    All input and output goes through `backend`, which defaults to the
+    terminal. Pass a `vscii.MemoryBackend` with scripted keys to play without
+    one.
+    """
+    framebuffer: vscii.FrameBuffer
+    nodes: dict
+    player: Player
+    enemy: Entity = None
+
+    def __init__(self, backend: vscii.Backend = None):
+        # Create a framebuffer.
+        self.framebuffer = vscii.FrameBuffer(backend)
+        # Make the framebuffer volatile so that it redraws each frame.
+        self.framebuffer.volatile = True
+        self.player = Player()
+
+        # Construct this screen's tree.
+        self.nodes = vscii.read_tree({
+            "screen" : (vscii.FullScreen(), {
+                "vsplit" : (vscii.VSplit(), {
+                    "lefthsplit" : (vscii.HSplit(), {
+                        "environment" : Environment(),
+                        "player_console" : PlayerConsole(),
+                    }),
+                    "righthsplit" : (vscii.HSplit(), {
+                        "inventory" : InventoryMenu(),
+                        "player_menu" : PlayerMenu(self.player),
+                    }),
+                })
             })
         })
-    })
-    framebuffer.add_elem(nodes["screen"])
-
-    # Configure nodes.
-    nodes["player_console"].border = ""
-
-    framebuffer.render()
-
-    nodes["player_console"].print("What is your name?")
-    player.name = nodes["player_console"].input(framebuffer)
-    nodes["player_console"].clear()
-
-    # Process player commands.
-    enemy = Entity("Test")
-    nodes["player_console"].print(f"A {enemy.name} appeared!\n")
-    while True:
-        command: list = nodes["player_console"].input(framebuffer).strip().split()
-
+        self.framebuffer.add_elem(self.nodes["screen"])
+
+        # Configure nodes. The console gets its own window, so that the
+        # terminal can scroll it rather than it being redrawn.
+        self.nodes["player_console"].border = ""
+        self.nodes["player_console"].own_window = True
+
+    def print(self, text: str):
+        self.nodes["player_console"].print(text)
+
+    def start(self):
+        """ Ask for the player's name and bring out the first enemy.
+        """
+        self.framebuffer.render()
+
+        self.print("What is your name?")
+        self.player.name = self.nodes["player_console"].input(self.framebuffer)
+        self.nodes["player_menu"].mark_dirty()
+        self.nodes["player_console"].clear()
+
+        self.enemy = Entity("Test")
+        self.print(f"A {self.enemy.name} appeared!\n")
+
+    def read_command(self) -> list:
+        """ Wait for the player to type a command, returning its words.
+        """
+        return self.nodes["player_console"].input(self.framebuffer).strip().split()
+
+    def select_item(self) -> Item:
+        inventory: InventoryMenu = self.nodes["inventory"]
+        if not inventory.items:
+            return None
+        return inventory.items[vscii.SelectList.input(self.framebuffer,
+            inventory.get_left() + 2,
+            inventory.get_top() + 2,
+            len(inventory.items), "→"
+        )]
+
+    def execute(self, command: list) -> bool:
+        """ Carry out a command, returning False once the player exits.
+        """
         if not command:
-            continue
+            return True
 
         if command[0] == "exit":
-            break
+            return False
         elif command[0] == "use":
             # Either allow the player to select options directly from the
             # inventory, or to pass an item name as an argument to `use`.
             item = None
             if len(command) > 1:
-                item = nodes["inventory"].get_item(command[1])
+                item = self.nodes["inventory"].get_item(command[1])
             else:
-                item = select_item()
+                item = self.select_item()
 
             if not item is None:
-                item.use()
+                item.use(self)
+            elif len(command) == 1:
+                self.print("You don't have anything to use.\n")
             else:
                 # Decide between "a" and "an" using a regex.
-                nodes["player_console"].print(f"You don't have any"
+                self.print(f"You don't have any"
                     + ("n" if re.match(r"^[aeiou]", command[1]) else "")
-                    + f" \"{command[1]}\" right now.")
+                    + f" \"{command[1]}\" right now.\n")
         else:
-            nodes["player_console"].print(f"Unknown command: \"{command}\"\n")
+            self.print(f"Unknown command: \"{command}\"\n")
+        return True
+
+    def run(self):
+        """ Play until the player exits.
+        """
+        self.start()
+
+        # Process player commands.
+        while self.execute(self.read_command()):
+            pass
 
 def __main__():
-    game()
+    GameSession().run()
 
 if __name__ == "__main__":
-    __main__()
\ No newline at end of file
+    __main__()
@@ -0,0 +1,79 @@
+import argparse
+import curses
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import game
+import vscii
+
+# Each session plays one of these, typed as if by the player.
+SCRIPTS: list = [
+    list("Alice\nuse sword\nuse food\nuse food\nlook around\nuse sword\nexit\n"),
+    list("Bob\nuse\n") + [curses.KEY_DOWN] + list("\nuse\n\nuse\n\nuse apple\nexit\n"),
+    list("Carol\n" + "use sword\n" * 10 + "use elixir\nexit\n"),
+]
+
+def play(script: list, width: int, height: int) -> list:
+    """ Play one scripted session without a terminal, returning how long each
+    command took to carry out and draw.
+    """
+    session = game.GameSession(vscii.MemoryBackend(width, height, script))
+    session.start()
+    latencies: list = list()
+    while True:
+        try:
+            command: list = session.read_command()
+        except EOFError:
+            break
+        start: float = time.perf_counter()
+        running: bool = session.execute(command)
+        session.framebuffer.render()
+        latencies.append(time.perf_counter() - start)
+        if not running:
+            break
+    return latencies
+
+def play_many(first: int, count: int, width: int, height: int) -> list:
+    """ Play sessions `first` to `first + count`, returning every command's
+    latency.
+    """
+    latencies: list = list()
+    for i in range(first, first + count):
+        latencies += play(SCRIPTS[i % len(SCRIPTS)], width, height)
+    return latencies
+
+def __main__():
+    parser = argparse.ArgumentParser(description="Play many scripted games at once without a terminal.")
+    parser.add_argument("--sessions", type=int, default=2000,
+        help="number of sessions to play")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+        help="number of processes to play them in")
+    parser.add_argument("--chunk", type=int, default=50,
+        help="number of sessions each process plays at a time")
+    parser.add_argument("--size", default="80x24",
+        help="screen size, as WIDTHxHEIGHT")
+    args = parser.parse_args()
+    width, height = (int(part) for part in args.size.split("x"))
+
+    latencies: list = list()
+    start: float = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        chunks = [pool.submit(play_many, first, min(args.chunk, args.sessions - first),
+            width, height) for first in range(0, args.sessions, args.chunk)]
+        for chunk in chunks:
+            latencies += chunk.result()
+    elapsed: float = time.perf_counter() - start
+
+    if len(latencies) < 2:
+        sys.exit("Not enough commands were played to report on.")
+    percentiles: list = statistics.quantiles(latencies, n=100)
+    print(f"{args.sessions} sessions, {len(latencies)} commands in {elapsed:.2f}s "
+        f"with {args.workers} workers")
+    print(f"{len(latencies) / elapsed:.0f} commands/s")
+    print("latency " + "  ".join(f"p{p}={percentiles[p - 1] * 1000:.3f}ms"
+        for p in (50, 90, 99)) + f"  max={max(latencies) * 1000:.3f}ms")
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,527 @@
+import asyncio
+import curses
+import fcntl
+import gc
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import termios
+import bench
+import game
+import vscii
+
+# The game after playing a couple of commands, at 60x14.
+GAME_SCREEN: list = [
+    "##############################|                            |",
+    "##############################|         Inventory          |",
+    "##############################|   Sword                    |",
+    "##############################|                            |",
+    "##############################|                            |",
+    "______________________________|____________________________|",
+    "healed 0 points of health.    |                            |",
+    "You strike the Test with      |           Alice            |",
+    "your Sword.                   |                            |",
+    "                              |   Health: 100 / 100        |",
+    "                              |                            |",
+    "                              |____________________________|",
+    "                                                            ",
+    "                                                            ",
+]
+
+def play(keys: str, commands: int) -> vscii.MemoryBackend:
+    """ Start a game on an in-memory screen and play `commands` of `keys`.
+    """
+    backend = vscii.MemoryBackend(60, 14, keys)
+    session = game.GameSession(backend)
+    session.start()
+    for i in range(commands):
+        session.execute(session.read_command())
+        session.framebuffer.render()
+    return backend
+
+def test_game_screen():
+    backend = play("Alice\nuse food\nuse sword please now\n", 2)
+    assert backend.get_lines() == GAME_SCREEN
+
+def test_input_line_repainted():
+    # The backend echoes typed text itself, so a shorter command typed on the
+    # same line must not leave the end of the longer one behind.
+    backend = vscii.MemoryBackend(60, 14, "Alice\nuse sword please now\nxy\n")
+    prompts: list = list()
+    getstr = backend.getstr
+
+    def record(row: int, column: int, max_length: int) -> str:
+        prompts.append(backend.get_lines()[row][column:column + max_length])
+        return getstr(row, column, max_length)
+
+    backend.getstr = record
+    session = game.GameSession(backend)
+    session.start()
+    session.execute(session.read_command())
+    session.read_command()
+    assert [prompt.strip() for prompt in prompts] == ["", "", ""]
+
+def test_layout_per_framebuffer():
+    # Changing one framebuffer's tree only lays that framebuffer out again.
+    first = vscii.FrameBuffer(vscii.MemoryBackend(40, 8))
+    second = vscii.FrameBuffer(vscii.MemoryBackend(40, 8))
+    for framebuffer in (first, second):
+        fullscreen = vscii.FullScreen()
+        fullscreen.add_child(vscii.TextDisplay())
+        framebuffer.add_elem(fullscreen)
+        framebuffer.render()
+        assert framebuffer.layout() == []
+
+    key: tuple = second._layout_key
+    changes: int = second._change_serial
+    display = vscii.TextDisplay()
+    first.elements[0].add_child(display)
+    display.print("hello")
+    assert first.layout() == [display]
+    assert (display.width, display.height) == (40, 7)
+    assert second.layout() == []
+    assert (second._layout_key, second._change_serial) == (key, changes)
+
+def test_text_rewrapped_lazily():
+    display = vscii.TextDisplay(history=10000)
+    for i in range(10000):
+        display.print(f"Line {i} has a few words to wrap.\n")
+    display.print("unfinished line")
+    rows: list = display.visible_rows(20, 4)
+    surface = vscii.Surface(20, 4)
+    for i in range(len(rows)):
+        surface.blit(rows[i], 0, i)
+    assert [surface.get_row(i).rstrip() for i in range(4)] == [
+        "words to wrap.", "Line 9999 has a few", "words to wrap.", "unfinished line"]
+
+    # Only the lines on screen were wrapped at the new width, and the last
+    # line is only wrapped again once more is printed to it.
+    assert sum(rows is not None for rows in display._wrapped) == 2
+    assert display.visible_rows(20, 4)[-1] is rows[-1]
+    display.print("!")
+    assert display.visible_rows(20, 4)[-1] is not rows[-1]
+
+def test_typeahead_not_kept():
+    backend = vscii.MemoryBackend(20, 4)
+    framebuffer = vscii.FrameBuffer(backend)
+    framebuffer._typeahead.extend(map(ord, "abc"))
+    backend.feed("d\n")
+    assert framebuffer.input(0, 1) == "abcd"
+    assert framebuffer.get_row(1) == " " * 20
+
+def test_typeahead_special_keys():
+    # Arrow keys and control characters typed ahead aren't text.
+    backend = vscii.MemoryBackend(20, 4)
+    framebuffer = vscii.FrameBuffer(backend)
+    framebuffer._typeahead.extend([ord("a"), curses.KEY_LEFT, 1, ord("中")])
+    backend.feed("b\n")
+    assert framebuffer.input(0, 1) == "a中b"
+
+def test_virtual_list():
+    backend = vscii.MemoryBackend(20, 6)
+    framebuffer = vscii.FrameBuffer(backend)
+    items: list = [f"item {i}" for i in range(100000)]
+    listing = vscii.VirtualList(items)
+    listing.width = 12
+    listing.height = 4
+    framebuffer.add_elem(listing)
+    framebuffer.focus = listing
+
+    for key in (curses.KEY_NPAGE, curses.KEY_DOWN, curses.KEY_LEFT):
+        framebuffer.dispatch(key)
+    assert (listing.get_selection(), listing.search) == (5, "")
+    for char in "item 9999":
+        framebuffer.dispatch(ord(char))
+    assert listing.get_selection() == 9999
+    framebuffer.dispatch(curses.KEY_END)
+    framebuffer.render()
+    assert [line[:12] for line in backend.get_lines()[:4]] == [
+        " item 99996 ", " item 99997 ", " item 99998 ", "#item 99999 "]
+
+def test_log_view():
+    path: str = os.path.join(tempfile.mkdtemp(), "service.log")
+    with open(path, "w") as file:
+        file.writelines(f"line {i}\n" for i in range(1000))
+    view = vscii.LogView(path)
+    view.width = 10
+    view.height = 3
+    surface = vscii.Surface(10, 3)
+    rows = lambda: [surface.get_row(row).rstrip() for row in range(3)]
+    try:
+        view._render(surface)
+        assert rows() == ["line 997", "line 998", "line 999"]
+
+        # Appends are followed, and long lines are wrapped.
+        with open(path, "a") as file:
+            file.write("a long line which wraps\n")
+        view._render(surface)
+        assert rows() == ["a long lin", "e which wr", "aps"]
+
+        view.scroll(-2)
+        view._render(surface)
+        assert rows() == ["line 998", "line 999", "a long lin"]
+        view._indexer.join()
+        assert view.goto_line(500)
+        view._render(surface)
+        assert rows() == ["line 500", "line 501", "line 502"]
+    finally:
+        view.close()
+
+def test_profiler_stats():
+    backend = vscii.MemoryBackend(40, 8)
+    framebuffer = vscii.FrameBuffer(backend)
+    framebuffer.profiler = vscii.Profiler(overlay=True)
+    fullscreen = vscii.FullScreen()
+    display = vscii.TextDisplay()
+    display.print("profiled")
+    fullscreen.add_child(display)
+    framebuffer.add_elem(fullscreen)
+    framebuffer.render()
+    framebuffer.render()
+
+    stats: dict = framebuffer.profiler.stats()
+    assert stats["frames"] == 2
+    assert sum(stats["frame_time"].values()) == sum(stats["io_time"].values()) == 2
+    records: dict = {entry["name"]: entry for entry in stats["elements"]}
+    assert records["FullScreen"]["renders"] == records["TextDisplay"]["renders"] == 2
+    assert records["FullScreen"]["time"] >= records["TextDisplay"]["time"]
+    assert records["TextDisplay"]["blits"] > 0 and records["TextDisplay"]["cells"] > 0
+    # The overlay shows the frames counted before it was drawn.
+    assert "1 frames" in backend.get_lines()[0]
+    assert "TextDisplay" in "".join(backend.get_lines()[1:4])
+
+def test_profiler_lets_go_of_elements():
+    framebuffer = vscii.FrameBuffer(vscii.MemoryBackend(20, 4))
+    framebuffer.profiler = vscii.Profiler()
+    display = vscii.TextDisplay()
+    framebuffer.add_elem(display)
+    framebuffer.render()
+    assert len(framebuffer.profiler.elements) == 1
+    display.detach()
+    del display
+    gc.collect()
+    assert len(framebuffer.profiler.elements) == 0
+
+def test_typeahead_drained_before_render():
+    backend = vscii.MemoryBackend(20, 4, [curses.KEY_DOWN, curses.KEY_DOWN, "\n"])
+    framebuffer = vscii.FrameBuffer(backend)
+    renders: list = list()
+    render = framebuffer.render
+    framebuffer.render = lambda: renders.append(render())
+    assert vscii.SelectList.input(framebuffer, 0, 0, 3) == 2
+    assert len(renders) == 1
+
+def test_async_input_line():
+    backend = vscii.MemoryBackend(20, 4, ["a", curses.KEY_LEFT, "\x01", "b", "\n"])
+    driver = vscii.AsyncDriver(vscii.FrameBuffer(backend), fps=1000)
+    assert asyncio.run(driver.run(driver.input_line(0, 1))) == "ab"
+
+def test_resize_debounced():
+    backend = vscii.MemoryBackend(20, 4)
+    framebuffer = vscii.FrameBuffer(backend)
+    framebuffer.resize_delay = 0
+    framebuffer.blit("keep", 0, 0)
+    resizes: list = list()
+    resize = framebuffer.resize
+    framebuffer.resize = lambda: resizes.append(resize())
+
+    # Both resizes are handled by one reallocation, and the key typed in the
+    # meantime is kept.
+    backend.resize(30, 5)
+    backend.resize(10, 6)
+    backend.feed("a")
+    assert framebuffer.getch() == ord("a")
+    assert len(resizes) == 1
+    assert (framebuffer.get_width(), framebuffer.get_height()) == (10, 6)
+    assert framebuffer.get_row(0) == "keep      "
+    framebuffer.render()
+    assert backend.get_lines()[0] == "keep      "
+
+def test_backends_implement_input():
+    # Every backend which reads from a terminal must implement all of the
+    # input functions, or the drivers fail on the default backend.
+    for backend in (vscii.CursesBackend, vscii.AnsiBackend):
+        for name in ("getch", "poll_key", "fileno", "getstr"):
+            assert getattr(backend, name) is not getattr(vscii.Backend, name), \
+                f"{backend.__name__} does not implement {name}()"
+
+def test_curses_backend_input():
+    # The curses backend reads keys from its own window, which is stood in for
+    # here since curses needs a terminal.
+    keys: list = [ord("a"), -1]
+
+    class Window(object):
+        def getch(self) -> int:
+            return keys.pop(0)
+
+        def nodelay(self, flag: bool):
+            return
+
+    backend = object.__new__(vscii.CursesBackend)
+    backend._window = Window()
+    assert backend.getch() == ord("a")
+    assert backend.poll_key() == -1
+
+def test_ansi_utf8_input():
+    keys_read, keys_write = os.pipe()
+    screen_read, screen_write = os.pipe()
+    os.write(keys_write, "é\x1b[D中\n".encode("utf-8"))
+    os.close(keys_write)
+    backend = vscii.AnsiBackend(screen_write, keys_read)
+    try:
+        assert backend.getstr(0, 0, 10) == "é中"
+    finally:
+        backend.close()
+        for fd in (keys_read, screen_read, screen_write):
+            os.close(fd)
+
+def test_ansi_cursor_at_right_margin():
+    master, slave = os.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", 5, 20, 0, 0))
+    backend = vscii.AnsiBackend(slave, slave)
+    try:
+        assert backend.get_size() == (5, 20)
+        # The terminal is left waiting to wrap on the last column, so the next
+        # write has to move the cursor absolutely.
+        backend.write(0, 18, "中")
+        backend.write(0, 18, "ab")
+        assert backend._payload[-2:] == ["\x1b[1;19H", "ab"]
+        # Anywhere else, the cursor is still moved relatively.
+        backend.write(1, 0, "ab")
+        backend.write(1, 5, "c")
+        assert backend._payload[-2:] == ["\x1b[3C", "c"]
+    finally:
+        backend.close()
+        os.close(master)
+        os.close(slave)
+
+def test_own_window_regions():
+    regions: list = list()
+    backend = vscii.MemoryBackend(40, 9)
+    backend.set_regions = regions.append
+    framebuffer = vscii.FrameBuffer(backend)
+    vsplit = vscii.VSplit()
+    left, right = vscii.TextDisplay(), vscii.TextDisplay()
+    right.own_window = True
+    vsplit.children = [left, right]
+    fullscreen = vscii.FullScreen()
+    fullscreen.add_child(vsplit)
+    framebuffer.add_elem(fullscreen)
+
+    framebuffer.render()
+    framebuffer.render()
+    assert regions == [[(0, 20, 8, 20)]]
+    # New windows start out blank, so everything is sent again.
+    backend.resize(60, 9)
+    framebuffer.resize()
+    framebuffer.render()
+    assert regions[1:] == [[(0, 30, 8, 30)]]
+    assert framebuffer.rows_written == 8
+
+def test_scroll_flushed():
+    backend = vscii.MemoryBackend(20, 6)
+    framebuffer = vscii.FrameBuffer(backend)
+    display = vscii.TextDisplay(border="")
+    fullscreen = vscii.FullScreen()
+    fullscreen.add_child(display)
+    framebuffer.add_elem(fullscreen)
+    display.print("one\ntwo\nthree\n")
+    framebuffer.render()
+
+    # Only a blank row is added, so once the terminal has been scrolled there
+    # are no rows left to write, but the scroll must still be sent.
+    flushes: int = backend.flushes
+    display.print("\n")
+    framebuffer.render()
+    assert framebuffer.rows_written == 0
+    assert backend.flushes == flushes + 1
+    assert [line.strip() for line in backend.get_lines()[1:4]] == ["two", "three", ""]
+
+def test_element_slots():
+    path: str = os.path.join(tempfile.mkdtemp(), "empty.log")
+    open(path, "w").close()
+    log = vscii.LogView(path)
+    for elem in (vscii.FBElement(), vscii.HSplit(), vscii.TextDisplay(),
+            vscii.SelectList(), vscii.VirtualList([]), vscii._LineEdit(), log):
+        assert not hasattr(elem, "__dict__"), type(elem).__name__
+    log.close()
+
+    # A subclass's class attributes are left alone, and still work as
+    # defaults.
+    class Panel(vscii.FBElement):
+        cached = True
+
+    panel = Panel()
+    assert Panel.cached is True and panel.cached is True and panel.width == 0
+    panel.cached = False
+    assert panel.cached is False and Panel().cached is True
+
+def test_cached_container_children():
+    backend = vscii.MemoryBackend(40, 8)
+    framebuffer = vscii.FrameBuffer(backend)
+    vsplit = vscii.VSplit()
+    vsplit.cached = True
+    left = vscii.TextDisplay()
+    left.print("left")
+    vsplit.add_child(left)
+    fullscreen = vscii.FullScreen()
+    fullscreen.add_child(vsplit)
+    framebuffer.add_elem(fullscreen)
+    framebuffer.render()
+
+    right = vscii.TextDisplay()
+    right.print("right")
+    vsplit.add_child(right)
+    framebuffer.render()
+    assert "right" in backend.get_lines()[1]
+
+    right.detach()
+    framebuffer.render()
+    assert "right" not in backend.get_lines()[1]
+
+def test_drawing_primitives():
+    surface = vscii.Surface(8, 5)
+    surface.box(0, 0, 5, 4, fill=".")
+    surface.box(4, 2, 6, 4, style="ascii")
+    surface.hline("=", -2, 4, 5)
+    surface.vline("|", 7, 0, 2)
+    surface.clear_rect(1, 1, 1, 1)
+    assert [surface.get_row(row) for row in range(5)] == [
+        "┌───┐  |",
+        "│ ..│  |",
+        "│...+---",
+        "└───|   ",
+        "=== |   ",
+    ]
+
+def test_fill_over_wide_characters():
+    surface = vscii.Surface(10, 1)
+    surface.blit("中abc", 0, 0)
+    surface.fill_rect("x", 1, 0, 1, 1)
+    assert surface.get_row(0) == " xabc     "
+    assert vscii.str_width(surface.get_row(0)) == 10
+
+def test_attribute_rows_bounded():
+    surface = vscii.Surface(10, 1)
+    for fg in range(256):
+        for bg in range(4):
+            surface.fill_rect("x", 0, 0, 10, 1, vscii.make_attr(fg, bg))
+    assert len(vscii._attr_rows) <= vscii._ATTR_ROWS
+    assert list(surface.get_attrs(0)) == [vscii.make_attr(255, 3)] * 10
+
+def test_bench_compare():
+    baseline: dict = {"results": [
+        {"name": "render", "size": "80x24", "seconds": 1.0, "best": 1.0, "peak_bytes": 1000},
+        {"name": "read_tree", "param": 10, "seconds": 1.0, "best": 1.0, "peak_bytes": 1000},
+    ]}
+    results: list = [dict(result) for result in baseline["results"]]
+    assert bench.compare(results, baseline, 0.25)
+    results[1]["peak_bytes"] = 1300
+    assert not bench.compare(results, baseline, 0.25)
+    results[1]["peak_bytes"] = 1000
+    results[0]["seconds"] = 1.3
+    assert not bench.compare(results, baseline, 0.25)
+    assert set(bench.measure(lambda: None, 3)) == {"seconds", "best", "peak_bytes"}
+
+def test_colors():
+    writes: list = list()
+    backend = vscii.MemoryBackend(20, 4)
+    write = backend.write
+    backend.write = lambda *args: writes.append(args) or write(*args)
+    framebuffer = vscii.FrameBuffer(backend)
+    red = vscii.make_attr(fg=1, flags=vscii.BOLD)
+    assert vscii.split_attr(red) == (1, -1, vscii.BOLD)
+    framebuffer.blit("ab", 0, 0, attr=red)
+    framebuffer.blit("cd", 2, 0)
+    framebuffer.render()
+    # Each run of cells which share an attribute is a single write.
+    assert [args for args in writes if args[0] == 0] == [
+        (0, 0, "ab", red), (0, 2, "cd                ")]
+    assert list(backend.screen.get_attrs(0, 0, 4)) == [red, red, 0, 0]
+
+def test_resize_to_nothing():
+    backend = vscii.MemoryBackend(20, 4, "a")
+    framebuffer = vscii.FrameBuffer(backend)
+    fullscreen = vscii.FullScreen()
+    fullscreen.add_child(vscii.TextDisplay())
+    framebuffer.add_elem(fullscreen)
+    framebuffer.blit("中", 0, 0)
+    framebuffer.render()
+    for width, height in ((0, 4), (20, 0), (0, 0), (20, 4)):
+        backend.resize(width, height)
+        framebuffer.resize()
+        framebuffer.render()
+        assert (framebuffer.get_width(), framebuffer.get_height()) == (width, height)
+    assert backend.get_lines()[0] == "#" * 20
+
+def test_recording_marks():
+    path: str = os.path.join(tempfile.mkdtemp(), "session.rec")
+    recorder = vscii.Recorder(vscii.MemoryBackend(60, 14, "Alice\nuse food\nexit\n"), path)
+    session = game.GameSession(recorder)
+    session.start()
+    recorder.mark("start")
+    # Every event is on disk straight away, in case the program crashes.
+    with open(path) as file:
+        assert file.read().endswith('m "start"\n')
+    while session.execute(session.read_command()):
+        pass
+    recorder.mark("end")
+    recorder.close()
+
+    replayer = vscii.Replayer(path)
+    session = game.GameSession(replayer)
+    session.run()
+    replayer.close()
+    assert [name for name, lines in replayer.checkpoints] == ["start", "end"]
+
+def test_viewer_keyframe_without_changes():
+    broadcaster = vscii.Broadcaster(vscii.MemoryBackend(20, 4), ("127.0.0.1", 0))
+    framebuffer = vscii.FrameBuffer(broadcaster)
+    framebuffer.blit("static", 0, 0)
+    framebuffer.render()
+
+    viewer = socket.create_connection(broadcaster.get_address(), timeout=1)
+    framebuffer.render()
+    length: int = struct.unpack(">I", viewer.recv(4, socket.MSG_WAITALL))[0]
+    message: dict = json.loads(viewer.recv(length, socket.MSG_WAITALL))
+    assert message["k"] == [4, 20]
+    viewer.close()
+    # Closing the framebuffer closes the broadcaster.
+    del framebuffer
+
+def test_broadcaster_keeps_other_files():
+    path: str = os.path.join(tempfile.mkdtemp(), "screen")
+    for i in range(2):
+        # A socket left behind is replaced.
+        vscii.Broadcaster(vscii.MemoryBackend(20, 4), path)._server.close()
+    os.unlink(path)
+    with open(path, "w") as file:
+        file.write("keep me")
+    try:
+        vscii.Broadcaster(vscii.MemoryBackend(20, 4), path)
+        assert False, "A regular file was replaced."
+    except FileExistsError:
+        pass
+    with open(path) as file:
+        assert file.read() == "keep me"
+
+def __main__():
+    failed: int = 0
+    for name, test in list(globals().items()):
+        if not name.startswith("test_"):
+            continue
+        try:
+            test()
+            print(f"\033[32mPASS: {name}")
+        except Exception as error:
+            failed += 1
+            print(f"\033[31mFAIL: {name}: {error!r}")
+    print("\033[0mFinished running test cases.")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,26 @@
+import sys
+import vscii
+
+def parse_address(address: str):
+    """ Accept either "host:port" for TCP or a path to a Unix socket.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return (host, int(port))
+    return address
+
+def __main__():
+    if len(sys.argv) != 2:
+        print("Usage: python3 viewer.py <host:port | socket path>")
+        return
+
+    viewer = vscii.StreamViewer(parse_address(sys.argv[1]))
+    try:
+        viewer.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        viewer.backend.close()
+
+if __name__ == "__main__":
+    __main__()
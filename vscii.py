@@ -3,9 +3,1455 @@ It supports frame buffer rendering and various modular elements which allow the
 user to expand upon the library with their own elements and containers.
 """
 
+import asyncio
+import bisect
+import codecs
 import curses
+import functools
+import json
+import mmap
+import os
+import queue
+import re
+import select
+import signal
+import socket
+import stat
+import struct
+import sys
+import termios
+import threading
+import time
+import tty
+import unicodedata
+import weakref
+from array import array
+from collections import deque
 
-class FrameBuffer(object):
+# Typecode for a single character cell. "u" is deprecated from Python 3.13
+# onwards in favour of "w".
+_CELL: str = "w" if sys.version_info >= (3, 13) else "u"
+# Fills the second cell of a double width character. It is never sent to the
+# terminal.
+_WIDE: str = "\uffff"
+# Typecode for a cell's attributes (see `make_attr()`).
+_ATTR: str = "I"
+
+# Text attributes which can be combined and passed to `make_attr()`.
+BOLD: int = 1
+DIM: int = 2
+ITALIC: int = 4
+UNDERLINE: int = 8
+BLINK: int = 16
+REVERSE: int = 32
+# Each attribute's name in curses (as `A_<name>`) and its SGR code.
+_FLAGS: tuple = (
+    (BOLD, "BOLD", 1),
+    (DIM, "DIM", 2),
+    (ITALIC, "ITALIC", 3),
+    (UNDERLINE, "UNDERLINE", 4),
+    (BLINK, "BLINK", 5),
+    (REVERSE, "REVERSE", 7),
+)
+
+# Corner and edge characters for `Surface.box()`, in the order: top left,
+# horizontal, top right, vertical, bottom left, bottom right.
+BOX_STYLES: dict = {
+    "ascii": "+-+|++",
+    "single": "┌─┐│└┘",
+    "double": "╔═╗║╚╝",
+    "heavy": "┏━┓┃┗┛",
+    "rounded": "╭─╮│╰╯",
+}
+
+class Sprite(object):
+    """ A graphic which has been parsed ahead of time.\n
+    Each row is stored as a list of `(offset, run)` pairs, where every run is a
+    contiguous group of opaque cells (see `to_cells()`). Build a sprite once
+    and pass it to `FrameBuffer.blit()` to avoid re-parsing the same art every
+    frame.\n
+    Sprites made by `Surface.to_sprite()` keep the attributes of each cell in
+    `attrs`, a list of attribute arrays matching each run. Otherwise `attrs`
+    is None, and the sprite is drawn with the attribute passed to `blit()`.
+    """
+    rows: list
+    attrs: list = None
+    width: int = 0
+    height: int = 0
+
+    def __init__(self, string: str, transparent: str = ""):
+        self.rows = list()
+
+        for line in string.split("\n"):
+            line = to_cells(line)
+            runs: list = list()
+            if transparent and transparent in line:
+                x = 0
+                for run in line.split(transparent):
+                    if run:
+                        runs.append((x, array(_CELL, run)))
+                    x += len(run) + 1
+            elif line:
+                runs.append((0, array(_CELL, line)))
+            self.rows.append(runs)
+            if len(line) > self.width:
+                self.width = len(line)
+        self.height = len(self.rows)
+
+class KeyMap(object):
+    """ A table of key bindings.\n
+    Keys may be given as key codes or single characters. Looking up a key is a
+    single dict access, and the bound action is called with whatever
+    arguments are passed to `dispatch()`.
+    """
+    bindings: dict
+
+    def __init__(self, bindings: dict = None):
+        self.bindings = dict()
+        if bindings is not None:
+            for key in bindings:
+                self.bind(key, bindings[key])
+
+    def bind(self, key, action):
+        """ Call `action` whenever `key` is dispatched.
+        """
+        self.bindings[ord(key) if isinstance(key, str) else key] = action
+
+    def unbind(self, key):
+        """ Remove the binding for `key`, if there is one.
+        """
+        self.bindings.pop(ord(key) if isinstance(key, str) else key, None)
+
+    def dispatch(self, key: int, *args) -> bool:
+        """ Run the action bound to `key`, returning False if there is none.
+        """
+        action = self.bindings.get(key)
+        if action is None:
+            return False
+        action(*args)
+        return True
+
+class Surface(object):
+    """ An off-screen grid of character cells.\n
+    Surfaces support the same drawing functions as a `FrameBuffer`, so an
+    element can render into one exactly as it would render to the screen.
+    Coordinates are offset by `origin_x` and `origin_y`, which lets an element
+    keep drawing at its own anchor.\n
+    Each cell also has an attribute (see `make_attr()`), stored in a plane
+    parallel to the characters. Every drawing function takes an `attr`, which
+    defaults to the terminal's normal colors. Until something is drawn with
+    another attribute the plane is left alone, so programs which don't use
+    color don't pay for it.
+    """
+    origin_x: int = 0
+    origin_y: int = 0
+    profiler = None
+    _buffer: array
+    _attrs: array
+    _styled: bool = False
+    _stride: int = 0
+    _rows: int = 0
+
+    def __init__(self, width: int, height: int, fill: str = " "):
+        self._stride = max(width, 0)
+        self._rows = max(height, 0)
+        self._buffer = array(_CELL, fill) * (self._stride * self._rows)
+        self._attrs = array(_ATTR, (0,)) * (self._stride * self._rows)
+
+    def blit(self, blit, xpos: int, ypos: int, transparent: str = "",
+            attr: int = 0):
+        """ Place a rectangular graphic onto the surface, overwriting anything
+        under it.\n
+        `blit` may be a string or a pre-parsed `Sprite`. An optional
+        transparency char can be provided which will be ignored (leaving the
+        underlying art the same). Anything outside of the surface is
+        clipped. Opaque cells are given `attr`, unless the sprite has
+        attributes of its own.
+        """
+        if not isinstance(blit, Sprite):
+            blit = Sprite(blit, transparent)
+        if self.profiler is not None:
+            self.profiler.blit()
+
+        xpos -= self.origin_x
+        row: int = ypos - self.origin_y - 1
+        for index, runs in enumerate(blit.rows):
+            row += 1
+            if row < 0:
+                continue
+            if row >= self._rows:
+                break
+            if blit.attrs is None:
+                for offset, run in runs:
+                    self._write(run, xpos + offset, row, attr)
+            else:
+                for (offset, run), attrs in zip(runs, blit.attrs[index]):
+                    self._write(run, xpos + offset, row, attrs)
+
+    def _write(self, run: array, x: int, row: int, attr):
+        """ Copy a single opaque run of characters onto a row, clipping it to
+        the surface.\n
+        `attr` is either a single attribute for the whole run, or an array of
+        them matching the run.
+        """
+        left: int = max(x, 0)
+        right: int = min(x + len(run), self._stride)
+        if left >= right:
+            return
+        start: int = row * self._stride
+        if right - left == len(run):
+            self._buffer[start + left:start + right] = run
+        else:
+            self._buffer[start + left:start + right] = run[left - x:right - x]
+        if type(attr) is not int:
+            self._styled = True
+            self._attrs[start + left:start + right] = attr[left - x:right - x]
+        elif attr or self._styled:
+            self._styled = True
+            attrs: array = _attr_rows.get(attr)
+            if attrs is None or len(attrs) < right - left:
+                attrs = _attr_row(attr, right - left)
+            self._attrs[start + left:start + right] = attrs[:right - left]
+
+        left, right = self._fix_edges(start, left, right)
+        self._damage(row, left, right)
+        if self.profiler is not None:
+            self.profiler.cells(right - left)
+
+    def _fix_edges(self, start: int, left: int, right: int) -> tuple:
+        """ Blank out any half of a double width character left at either end
+        of the cells just drawn from `left` to `right`, either from clipping
+        or from drawing over part of one. Returns the span which changed.
+        """
+        buffer: array = self._buffer
+        if buffer[start + left] == _WIDE:
+            buffer[start + left] = " "
+        if left > 0 and buffer[start + left - 1] != _WIDE \
+                and char_width(buffer[start + left - 1]) == 2:
+            buffer[start + left - 1] = " "
+            left -= 1
+        if right < self._stride and buffer[start + right] == _WIDE:
+            buffer[start + right] = " "
+            right += 1
+        if buffer[start + right - 1] != _WIDE and char_width(buffer[start + right - 1]) == 2:
+            buffer[start + right - 1] = " "
+        return left, right
+
+    def fill_rect(self, char: str, xpos: int, ypos: int, width: int, height: int,
+            attr: int = 0):
+        """ Fill a rectangle with a single character.\n
+        This is much faster than blitting the output of `create_rect()`, as
+        each row is filled with a single slice assignment.
+        """
+        xpos -= self.origin_x
+        ypos -= self.origin_y
+        left: int = max(xpos, 0)
+        right: int = min(xpos + width, self._stride)
+        if left >= right:
+            return
+        cells: str = to_cells(char)
+        if not cells:
+            return
+        run: array = array(_CELL, (cells * (right - left))[:right - left])
+        attrs: array = None
+        if attr or self._styled:
+            self._styled = True
+            attrs = _attr_row(attr, right - left)[:right - left]
+        for row in range(max(ypos, 0), min(ypos + height, self._rows)):
+            start: int = row * self._stride
+            self._buffer[start + left:start + right] = run
+            if attrs is not None:
+                self._attrs[start + left:start + right] = attrs
+            damaged: tuple = self._fix_edges(start, left, right)
+            self._damage(row, *damaged)
+            if self.profiler is not None:
+                self.profiler.cells(right - left)
+
+    def clear_rect(self, xpos: int, ypos: int, width: int, height: int,
+            attr: int = 0):
+        """ Fill a rectangle with spaces.
+        """
+        self.fill_rect(" ", xpos, ypos, width, height, attr)
+
+    def hline(self, char: str, xpos: int, ypos: int, length: int, attr: int = 0):
+        """ Draw a horizontal line of `length` characters.
+        """
+        self.fill_rect(char, xpos, ypos, length, 1, attr)
+
+    def vline(self, char: str, xpos: int, ypos: int, length: int, attr: int = 0):
+        """ Draw a vertical line of `length` characters.
+        """
+        self.fill_rect(char, xpos, ypos, 1, length, attr)
+
+    def box(self, xpos: int, ypos: int, width: int, height: int,
+            style: str = "single", fill: str = "", attr: int = 0):
+        """ Draw the outline of a rectangle.\n
+        `style` is either one of the names in `BOX_STYLES` or a string of six
+        characters in the same order. If `fill` is given the inside of the box
+        is filled with it, otherwise it is left untouched.
+        """
+        if width <= 0 or height <= 0:
+            return
+        top_left, horizontal, top_right, vertical, bottom_left, bottom_right = \
+            BOX_STYLES.get(style, style)
+        if fill:
+            self.fill_rect(fill, xpos + 1, ypos + 1, width - 2, height - 2, attr)
+        self.hline(horizontal, xpos + 1, ypos, width - 2, attr)
+        self.hline(horizontal, xpos + 1, ypos + height - 1, width - 2, attr)
+        self.vline(vertical, xpos, ypos + 1, height - 2, attr)
+        self.vline(vertical, xpos + width - 1, ypos + 1, height - 2, attr)
+        self.fill_rect(top_left, xpos, ypos, 1, 1, attr)
+        self.fill_rect(top_right, xpos + width - 1, ypos, 1, 1, attr)
+        self.fill_rect(bottom_left, xpos, ypos + height - 1, 1, 1, attr)
+        self.fill_rect(bottom_right, xpos + width - 1, ypos + height - 1, 1, 1, attr)
+
+    def scroll_region(self, row: int, column: int, height: int, width: int,
+            lines: int):
+        """ Move the contents of a rectangle up by `lines`, filling the rows
+        left at the bottom with spaces.
+        """
+        _shift_rect(self._buffer, self._stride, row - self.origin_y,
+            column - self.origin_x, height, width, lines)
+        if self._styled:
+            _shift_rect(self._attrs, self._stride, row - self.origin_y,
+                column - self.origin_x, height, width, lines, 0)
+
+    def get_width(self) -> int:
+        """ Return the width of the surface.
+        """
+        return self._stride
+
+    def get_height(self) -> int:
+        """ Return the height of the surface.
+        """
+        return self._rows
+
+    def get_row(self, row: int, left: int = 0, right: int = None) -> str:
+        """ Return the text of a row, or part of one, as it would be displayed.
+        """
+        start: int = row * self._stride
+        right = self._stride if right is None else right
+        text: str = self._buffer[start + left:start + right].tounicode()
+        if text.startswith(_WIDE):
+            text = " " + text[1:]
+        return text.replace(_WIDE, "")
+
+    def get_attrs(self, row: int, left: int = 0, right: int = None) -> array:
+        """ Return the attributes of a row, or part of one, one per cell.
+        """
+        start: int = row * self._stride
+        right = self._stride if right is None else right
+        return self._attrs[start + left:start + right]
+
+    def get_runs(self, row: int, left: int = 0, right: int = None) -> list:
+        """ Return a row, or part of one, as `(column, text, attr)` runs of
+        cells which share an attribute.
+        """
+        start: int = row * self._stride
+        right = self._stride if right is None else right
+        cells: str = self._buffer[start + left:start + right].tounicode()
+        if cells.startswith(_WIDE):
+            cells = " " + cells[1:]
+        return [(left + first, cells[first:last].replace(_WIDE, ""), attr)
+            for first, last, attr in _attr_runs(cells,
+                self._attrs[start + left:start + right])]
+
+    def to_sprite(self, transparent: str = "") -> Sprite:
+        """ Convert the contents of this surface into a `Sprite`, including
+        the attributes of each cell.
+        """
+        sprite = Sprite("\n".join(self.get_row(row) for row in range(self._rows)),
+            transparent)
+        if self._styled and self._attrs.count(0) != len(self._attrs):
+            sprite.attrs = [[self._attrs[row * self._stride + offset:
+                row * self._stride + offset + len(run)] for offset, run in runs]
+                for row, runs in enumerate(sprite.rows)]
+        return sprite
+
+    def _damage(self, row: int, left: int, right: int):
+        return
+
+class Backend(object):
+    """ Base class for terminal backends.\n
+    A backend performs all of the input and output for a `FrameBuffer`. The
+    curses backend is used by default, but anything implementing these
+    functions can be passed to the framebuffer instead.
+    """
+
+    def get_size(self) -> tuple:
+        """ Return the `(height, width)` of the screen.
+        """
+        raise NotImplementedError
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        """ Write a run of text to the screen, starting at `row` and `column`,
+        with the attribute `attr` (see `make_attr()`).\n
+        `attr` is only passed when it isn't 0, so backends which don't support
+        color can leave it out.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """ Display everything which has been written since the last flush.
+        """
+        return
+
+    def poll(self):
+        """ Called at the end of every frame, even when nothing was written,
+        for backends which have work of their own to do.
+        """
+        return
+
+    def getch(self) -> int:
+        """ Return a single keyboard input.
+        """
+        raise NotImplementedError
+
+    def poll_key(self) -> int:
+        """ Return a single keyboard input without waiting, or -1 if there is
+        none.
+        """
+        raise NotImplementedError
+
+    def fileno(self) -> int:
+        """ Return a file descriptor which becomes readable when input is
+        available, or None if input must be polled.
+        """
+        return None
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        """ Read a line of text, echoing it at `row` and `column`.
+        """
+        raise NotImplementedError
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        """ Move the contents of a rectangle up by `lines`, leaving blank rows
+        at the bottom. Returns False if the backend can't do this, in which
+        case nothing is changed.
+        """
+        return False
+
+    def set_regions(self, regions: list):
+        """ Called with the `(row, column, height, width)` of each element which
+        asked for its own window, whenever the layout changes. Backends may use
+        these to update independent parts of the screen separately.
+        """
+        return
+
+    def close(self):
+        """ Restore the terminal to its original state.
+        """
+        return
+
+class CursesBackend(Backend):
+    """ Draw to the terminal using curses.\n
+    Regions passed to `set_regions()` get their own curses windows. Writes are
+    routed to the window which covers them, and each flush only refreshes the
+    windows which were written to, with a single `curses.doupdate()`. Writes
+    to the main window also refresh every region, which it would otherwise
+    cover with stale blanks.\n
+    Color pairs are allocated the first time each combination of colors is
+    used, and the curses attribute for each `attr` is cached. Once every pair
+    is used up, new combinations are drawn in the default colors.
+    """
+    _window = None
+    _windows: list
+    _segments: list
+    _touched: set
+    _pairs: dict
+    _attrs: dict
+    _next_pair: int = 1
+
+    def __init__(self):
+        self._window = curses.initscr()
+        self._window.keypad(True)
+        curses.start_color()
+        try:
+            # Lets -1 stand for the terminal's own colors.
+            curses.use_default_colors()
+        except curses.error:
+            pass
+        curses.noecho()
+        self._windows = [(self._window, 0, 0)]
+        self._segments = list()
+        self._touched = set()
+        self._pairs = {(-1, -1): 0}
+        self._attrs = {0: 0}
+
+    def _curses_attr(self, attr: int) -> int:
+        # Convert an attribute from `make_attr()` into a curses attribute.
+        result: int = self._attrs.get(attr)
+        if result is not None:
+            return result
+        fg, bg, flags = split_attr(attr)
+        pair: int = self._pairs.get((fg, bg))
+        if pair is None:
+            pair = 0
+            if self._next_pair < curses.COLOR_PAIRS:
+                try:
+                    curses.init_pair(self._next_pair, fg, bg)
+                    pair = self._next_pair
+                    self._next_pair += 1
+                except curses.error:
+                    pass
+            self._pairs[(fg, bg)] = pair
+        result = curses.color_pair(pair)
+        for flag, name, code in _FLAGS:
+            if flags & flag:
+                result |= getattr(curses, "A_" + name, 0)
+        self._attrs[attr] = result
+        return result
+
+    def get_size(self) -> tuple:
+        return self._window.getmaxyx()
+
+    def set_regions(self, regions: list):
+        height, width = self._window.getmaxyx()
+        self._windows = [(self._window, 0, 0)]
+        owners: list = [[0] * width for row in range(height)]
+
+        # Later regions are drawn over earlier ones.
+        for row, column, rows, columns in regions:
+            top: int = max(row, 0)
+            bottom: int = min(row + rows, height)
+            left: int = max(column, 0)
+            right: int = min(column + columns, width)
+            if top >= bottom or left >= right:
+                continue
+            self._windows.append((curses.newwin(bottom - top, right - left, top, left),
+                top, left))
+            for line in owners[top:bottom]:
+                line[left:right] = [len(self._windows) - 1] * (right - left)
+
+        # Store each row as runs of `(left, right, window)`.
+        self._segments = list()
+        for line in owners:
+            runs: list = list()
+            for x in range(width):
+                if runs and runs[-1][2] == line[x]:
+                    runs[-1][1] = x + 1
+                else:
+                    runs.append([x, x + 1, line[x]])
+            self._segments.append(runs)
+        self._window.touchwin()
+        self._touched = set(range(len(self._windows)))
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        # Either the whole width of the screen, or the whole width of one of
+        # the region windows, can be scrolled.
+        window, top, left = self._windows[0]
+        if self._segments:
+            segments: list = [segment for segment in self._segments[row]
+                if segment[0] < column + width and segment[1] > column]
+            if len(segments) != 1:
+                return False
+            window, top, left = self._windows[segments[0][2]]
+        if column - left != 0 or width != window.getmaxyx()[1]:
+            return False
+
+        window.idlok(True)
+        window.scrollok(True)
+        window.setscrreg(row - top, row - top + height - 1)
+        window.scroll(lines)
+        window.setscrreg(0, window.getmaxyx()[0] - 1)
+        window.scrollok(False)
+        if self._segments:
+            self._touched.add(self._windows.index((window, top, left)))
+        return True
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        attr = self._curses_attr(attr)
+        if not self._segments:
+            self._window.addstr(row, column, text, attr)
+            return
+
+        # Split the text by cells, since that's what the regions cover.
+        cells: str = to_cells(text)
+        end: int = column + len(cells)
+        for left, right, index in self._segments[row]:
+            if right <= column or left >= end:
+                continue
+            start: int = max(left, column)
+            stop: int = min(right, end)
+            piece: str = cells[start - column:stop - column]
+            if not piece.isascii():
+                # A double width character split by the edge of a region
+                # can't be shown in either window.
+                if piece[0] == _WIDE:
+                    piece = " " + piece[1:]
+                if stop < end and cells[stop - column] == _WIDE:
+                    piece = piece[:-1] + " "
+                piece = piece.replace(_WIDE, "")
+            window, top, origin = self._windows[index]
+            try:
+                window.addstr(row - top, start - origin, piece, attr)
+            except curses.error:
+                # Writing the bottom right cell of a window moves the cursor
+                # off of it, which curses reports as an error.
+                pass
+            self._touched.add(index)
+
+    def flush(self):
+        if not self._segments:
+            self._window.refresh()
+            return
+
+        # The regions overlap the main window, which still holds blanks where
+        # they are. Refreshing it copies whole changed lines, including those
+        # blanks, so every region has to be copied back over it afterwards.
+        if 0 in self._touched:
+            for window, top, left in self._windows[1:]:
+                window.touchwin()
+            self._touched.update(range(len(self._windows)))
+        for index in sorted(self._touched):
+            self._windows[index][0].noutrefresh()
+        self._touched.clear()
+        curses.doupdate()
+
+    def getch(self) -> int:
+        return self._window.getch()
+
+    def poll_key(self) -> int:
+        self._window.nodelay(True)
+        key: int = self._window.getch()
+        self._window.nodelay(False)
+        return key
+
+    def fileno(self) -> int:
+        return sys.stdin.fileno()
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        curses.echo()
+        result: str = self._window.getstr(row, column, max_length).decode("utf-8")
+        curses.noecho()
+        return result
+
+    def close(self):
+        curses.echo()
+        curses.endwin()
+
+class AnsiBackend(Backend):
+    """ Draw to the terminal with raw ANSI escape sequences.\n
+    Everything written during a frame is encoded into a single payload, using
+    the shortest cursor movement between each run, and sent with one `write`
+    call when the frame is flushed. `bytes_written` and `writes` report the
+    size of the last frame and how many frames have been sent.\n
+    When created on the main thread, the backend catches SIGWINCH and reports
+    it as `curses.KEY_RESIZE`, the same as curses does.\n
+    Frames are written to `fd` (stdout by default) and keys are read from
+    `input_fd` (stdin by default), so input can be piped in from a file. Input
+    is decoded as UTF-8.
+    """
+    bytes_written: int = 0
+    writes: int = 0
+    _fd: int
+    _input: int
+    _payload: list
+    _decoder: codecs.IncrementalDecoder
+    _chars: str = ""
+    _width: int = None
+    _cursor: tuple = None
+    _attr: int = 0
+    _attributes = None
+    _wake: tuple = None
+    _old_handler = None
+
+    # Escape sequences for the keys which `SelectList` and friends expect.
+    _KEYS: dict = {
+        "A": curses.KEY_UP,
+        "B": curses.KEY_DOWN,
+        "C": curses.KEY_RIGHT,
+        "D": curses.KEY_LEFT,
+        "H": curses.KEY_HOME,
+        "F": curses.KEY_END,
+    }
+
+    def __init__(self, fd: int = None, input_fd: int = None):
+        self._fd = sys.stdout.fileno() if fd is None else fd
+        self._input = sys.stdin.fileno() if input_fd is None else input_fd
+        self._payload = list()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        # Piped input has no terminal settings to change.
+        if os.isatty(self._input):
+            self._attributes = termios.tcgetattr(self._input)
+            tty.setcbreak(self._input)
+        if threading.current_thread() is threading.main_thread():
+            # The signal handler writes to a pipe, which wakes up `getch()`.
+            self._wake = os.pipe()
+            os.set_blocking(self._wake[1], False)
+            self._old_handler = signal.signal(signal.SIGWINCH, self._on_resize)
+        # Switch to the alternate screen and clear it.
+        self._payload.append("\x1b[?1049h\x1b[2J")
+        self.flush()
+
+    def get_size(self) -> tuple:
+        try:
+            size = os.get_terminal_size(self._fd)
+        except OSError:
+            size = os.get_terminal_size(self._input)
+        self._width = size.columns
+        return (size.lines, size.columns)
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        # Scroll margins always cover the full width of the terminal.
+        if column != 0 or width != self.get_size()[1]:
+            return False
+        # New lines would be filled with the current background color.
+        if self._attr:
+            self._payload.append("\x1b[0m")
+            self._attr = 0
+        self._payload.append(f"\x1b[{row + 1};{row + height}r\x1b[{lines}S\x1b[r")
+        # Setting the margins moves the cursor to the top left.
+        self._cursor = None
+        return True
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        self._payload.append(_cursor_move(self._cursor, row, column))
+        if attr != self._attr:
+            self._payload.append(_sgr(attr))
+            self._attr = attr
+        self._payload.append(text)
+        end: int = column + str_width(text)
+        # Writing the last column leaves the cursor on it until the next
+        # character arrives, so its position can't be relied on.
+        self._cursor = (row, end) if self._width is None or end < self._width else None
+
+    def flush(self):
+        payload: bytes = "".join(self._payload).encode("utf-8")
+        self._payload.clear()
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(self._fd, view):]
+        self.bytes_written = len(payload)
+        self.writes += 1
+
+    def _on_resize(self, signum, frame):
+        try:
+            os.write(self._wake[1], b"\0")
+        except BlockingIOError:
+            # A resize is already waiting to be reported.
+            pass
+
+    def _take_resize(self, timeout: float = 0) -> bool:
+        # Wait up to `timeout` for either input or a resize, returning True
+        # (and clearing it) if it was a resize.
+        if self._wake is None:
+            return False
+        readable: list = select.select([self._input, self._wake[0]], [], [], timeout)[0]
+        if self._wake[0] not in readable:
+            return False
+        os.read(self._wake[0], 4096)
+        return True
+
+    def _read_char(self) -> str:
+        # Read a single character, however many bytes it takes, returning ""
+        # at the end of the input.
+        while not self._chars:
+            data: bytes = os.read(self._input, 1)
+            if not data:
+                self._decoder.reset()
+                return ""
+            self._chars = self._decoder.decode(data)
+        char: str = self._chars[0]
+        self._chars = self._chars[1:]
+        return char
+
+    def getch(self) -> int:
+        if not self._chars and self._take_resize(None):
+            return curses.KEY_RESIZE
+        key: str = self._read_char()
+        if not key:
+            raise EOFError("Reached the end of the input.")
+        if key != "\x1b":
+            return ord(key)
+        # Arrow keys and friends arrive as a whole sequence at once.
+        sequence: str = ""
+        while self._chars or select.select([self._input], [], [], 0)[0]:
+            char: str = self._read_char()
+            sequence += char
+            if not char or char.isalpha() or char == "~":
+                break
+        return self._KEYS.get(sequence[-1:], 27) if sequence.startswith("[") else 27
+
+    def poll_key(self) -> int:
+        if self._take_resize():
+            return curses.KEY_RESIZE
+        if self._chars or select.select([self._input], [], [], 0)[0]:
+            try:
+                return self.getch()
+            except EOFError:
+                # The end of piped input is reported by the next `getch()`.
+                return -1
+        return -1
+
+    def fileno(self) -> int:
+        return self._input
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        result: str = ""
+        while True:
+            key: int = self.getch()
+            if key == ord("\n"):
+                break
+            elif key in (127, 8):
+                result = result[:-1]
+            elif _is_text_key(key) and len(result) < max_length:
+                result += chr(key)
+            self.write(row, column, result + " ")
+            self.flush()
+        return result
+
+    def close(self):
+        self._payload.append("\x1b[0m\x1b[?1049l")
+        self.flush()
+        if self._attributes is not None:
+            termios.tcsetattr(self._input, termios.TCSADRAIN, self._attributes)
+        if self._wake is not None:
+            signal.signal(signal.SIGWINCH, self._old_handler)
+            os.close(self._wake[0])
+            os.close(self._wake[1])
+            self._wake = None
+
+class MemoryBackend(Backend):
+    """ An in-memory screen which doesn't need a terminal.\n
+    Keyboard input is scripted with `feed()`, which accepts key codes or
+    strings, and the resulting screen can be read back with `get_lines()`.
+    Running out of scripted input raises `EOFError`.
+    """
+    screen: Surface
+    keys: deque
+    flushes: int = 0
+
+    def __init__(self, width: int = 80, height: int = 24, keys = ()):
+        self.screen = Surface(width, height)
+        self.keys = deque()
+        self.feed(keys)
+
+    def feed(self, keys):
+        """ Queue up keyboard input, either as a string or key codes.
+        """
+        for key in keys:
+            self.keys.append(ord(key) if isinstance(key, str) else key)
+
+    def resize(self, width: int, height: int):
+        """ Change the size of the screen, keeping whatever still fits, and
+        queue a `curses.KEY_RESIZE` like a real terminal would.
+        """
+        old: Surface = self.screen
+        self.screen = Surface(width, height)
+        self.screen.blit(old.to_sprite(), 0, 0)
+        self.keys.append(curses.KEY_RESIZE)
+
+    def get_lines(self) -> list:
+        """ Return the contents of the screen as a list of rows.
+        """
+        return [self.screen.get_row(row) for row in range(self.screen._rows)]
+
+    def get_size(self) -> tuple:
+        return (self.screen._rows, self.screen._stride)
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        self.screen.scroll_region(row, column, height, width, lines)
+        return True
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        self.screen.blit(text, column, row, attr=attr)
+
+    def flush(self):
+        self.flushes += 1
+
+    def getch(self) -> int:
+        if not self.keys:
+            raise EOFError("Ran out of scripted input.")
+        return self.keys.popleft()
+
+    def poll_key(self) -> int:
+        return self.keys.popleft() if self.keys else -1
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        result: str = ""
+        while True:
+            key: int = self.getch()
+            if key == ord("\n"):
+                break
+            if len(result) < max_length:
+                result += chr(key)
+        self.screen.blit(result, column, row)
+        return result
+
+class Recorder(Backend):
+    """ Record the input of another backend to a file.\n
+    Every key read from `backend` is written to `path`, along with the time
+    since the previous event when `timestamps` is set. Call `mark()` to
+    record a checkpoint, which `Replayer` will capture the screen at. The
+    recording is a small text file with one event per line:\n
+    `k <ms> <key>` for a key, `s <ms> <json>` for a line of text,
+    `r <ms> <json>` for a resize to `[width, height]` and `m <json>` for a
+    checkpoint.
+    """
+    backend: Backend
+    timestamps: bool
+    _file = None
+    _last: float
+
+    def __init__(self, backend: Backend, path: str, timestamps: bool = True):
+        self.backend = backend
+        self.timestamps = timestamps
+        # Line buffered, so a session which crashes keeps its recording.
+        self._file = open(path, "w", buffering=1)
+        height, width = backend.get_size()
+        self._file.write(f"vscii 1 {width} {height}\n")
+        self._last = time.monotonic()
+
+    def _record(self, kind: str, value: str):
+        now: float = time.monotonic()
+        delay: int = round((now - self._last) * 1000) if self.timestamps else 0
+        self._last = now
+        self._file.write(f"{kind} {delay} {value}\n")
+
+    def mark(self, name: str = ""):
+        """ Record a checkpoint.
+        """
+        self._file.write(f"m {json.dumps(name)}\n")
+
+    def get_size(self) -> tuple:
+        return self.backend.get_size()
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        _send(self.backend, row, column, text, attr)
+
+    def flush(self):
+        self.backend.flush()
+
+    def poll(self):
+        self.backend.poll()
+
+    def _record_key(self, key: int):
+        if key == curses.KEY_RESIZE:
+            height, width = self.backend.get_size()
+            self._record("r", json.dumps([width, height]))
+        else:
+            self._record("k", str(key))
+
+    def getch(self) -> int:
+        key: int = self.backend.getch()
+        self._record_key(key)
+        return key
+
+    def poll_key(self) -> int:
+        key: int = self.backend.poll_key()
+        if key != -1:
+            self._record_key(key)
+        return key
+
+    def fileno(self) -> int:
+        return self.backend.fileno()
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        result: str = self.backend.getstr(row, column, max_length)
+        self._record("s", json.dumps(result))
+        return result
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        return self.backend.scroll(row, column, height, width, lines)
+
+    def set_regions(self, regions: list):
+        self.backend.set_regions(regions)
+
+    def close(self):
+        self._file.close()
+        self.backend.close()
+
+class Replayer(Backend):
+    """ Play back a recording made by `Recorder`.\n
+    Output goes to `backend`, which defaults to a `MemoryBackend` the size of
+    the recorded terminal. With `realtime` set, each event waits for its
+    recorded delay; otherwise input arrives as fast as it is read, so the
+    framebuffer drains it in large batches. Whenever a mark is reached, the
+    screen is saved to `checkpoints` as a `(name, lines)` pair, and marks
+    after the last input are saved by `close()`. Recorded resizes are applied
+    to `backend` if it has a `resize()` function. Running out of input raises
+    `EOFError`.
+    """
+    backend: Backend
+    realtime: bool
+    checkpoints: list
+    _events: deque
+    _due: float = 0
+
+    def __init__(self, path: str, backend: Backend = None, realtime: bool = False):
+        self.realtime = realtime
+        self.checkpoints = list()
+        self._events = deque()
+        with open(path) as file:
+            header: list = file.readline().split()
+            if header[:2] != ["vscii", "1"]:
+                raise ValueError(f"{path} is not a VSCII recording.")
+            for line in file:
+                kind, rest = line.rstrip("\n").split(" ", 1)
+                if kind == "m":
+                    self._events.append((kind, 0, json.loads(rest)))
+                else:
+                    delay, value = rest.split(" ", 1)
+                    self._events.append((kind, int(delay) / 1000,
+                        int(value) if kind == "k" else json.loads(value)))
+        self.backend = MemoryBackend(int(header[2]), int(header[3])) \
+            if backend is None else backend
+        self._due = time.monotonic()
+
+    def _next(self, kind: str, wait: bool = True):
+        # Return the value of the next input event, capturing any marks on the
+        # way. Returns None if the event isn't due yet and `wait` isn't set.
+        # Without `wait` marks aren't passed, so that the screen is rendered
+        # before it is captured.
+        if self._events and self._events[0][0] == "m":
+            if not wait:
+                return None
+            self._capture_marks()
+        if not self._events:
+            raise EOFError("Reached the end of the recording.")
+        if self._events[0][0] != kind:
+            return None
+
+        if self.realtime:
+            due: float = self._due + self._events[0][1]
+            delay: float = due - time.monotonic()
+            if delay > 0:
+                if not wait:
+                    return None
+                time.sleep(delay)
+            self._due = max(due, time.monotonic())
+        return self._events.popleft()[2]
+
+    def _capture_marks(self):
+        # Save the screen for each mark which is up next.
+        while self._events and self._events[0][0] == "m":
+            name: str = self._events.popleft()[2]
+            lines: list = self.backend.get_lines() \
+                if isinstance(self.backend, MemoryBackend) else None
+            self.checkpoints.append((name, lines))
+
+    def get_size(self) -> tuple:
+        return self.backend.get_size()
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        _send(self.backend, row, column, text, attr)
+
+    def flush(self):
+        self.backend.flush()
+
+    def poll(self):
+        self.backend.poll()
+
+    def _resize(self, wait: bool = True) -> int:
+        # Apply a resize if it's the next event, returning its key.
+        size: list = self._next("r", wait)
+        if size is None:
+            return None
+        if hasattr(self.backend, "resize"):
+            self.backend.resize(*size)
+        return curses.KEY_RESIZE
+
+    def getch(self) -> int:
+        key: int = self._next("k")
+        if key is None:
+            key = self._resize()
+        if key is None:
+            # A line of text was recorded, so hand it out a key at a time.
+            text: str = self._events.popleft()[2]
+            self._events.extendleft(("k", 0, key) for key in
+                reversed([ord(char) for char in text] + [ord("\n")]))
+            key = self._next("k")
+        return key
+
+    def poll_key(self) -> int:
+        try:
+            key: int = self._next("k", False)
+            if key is None:
+                key = self._resize(False)
+        except EOFError:
+            return -1
+        return -1 if key is None else key
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        result = self._next("s")
+        if result is None:
+            # Keys were recorded instead, such as from piped input.
+            result = ""
+            key: int = self.getch()
+            while key != ord("\n"):
+                result += chr(key)
+                key = self.getch()
+        result = result[:max_length]
+        self.backend.write(row, column, result)
+        return result
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        return self.backend.scroll(row, column, height, width, lines)
+
+    def set_regions(self, regions: list):
+        self.backend.set_regions(regions)
+
+    def close(self):
+        # Marks recorded after the last input are only reached once the
+        # program has finished.
+        self._capture_marks()
+        self.backend.close()
+
+class Broadcaster(Backend):
+    """ Mirror the output of another backend to viewers over a socket.\n
+    `address` is either a `(host, port)` pair for TCP or a path for a Unix
+    socket. An existing socket at the path is replaced, but any other file
+    raises `FileExistsError`. Viewers (see `StreamViewer`) receive a keyframe of the whole screen
+    on the first frame after they connect, whether or not anything changed,
+    and then one message per frame with only the spans which changed,
+    run-length encoded. Each frame is encoded once no matter
+    how many viewers there are. A viewer which falls more than `limit` bytes
+    behind has its backlog dropped and is sent a fresh keyframe instead.\n
+    Every message is a 4 byte big-endian length followed by JSON.
+    """
+    backend: Backend
+    limit: int
+    _server: socket.socket
+    _clients: list
+    _screen: Surface
+    _ops: list
+
+    def __init__(self, backend: Backend, address, limit: int = 1 << 20):
+        self.backend = backend
+        self.limit = limit
+        self._clients = list()
+        self._ops = list()
+        height, width = backend.get_size()
+        self._screen = Surface(width, height)
+
+        if isinstance(address, str):
+            # Only a socket left behind by an earlier broadcaster is replaced.
+            if os.path.exists(address):
+                if not stat.S_ISSOCK(os.stat(address).st_mode):
+                    raise FileExistsError(f"{address} exists and is not a socket.")
+                os.unlink(address)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen()
+        self._server.setblocking(False)
+
+    def get_address(self):
+        """ Return the address the server is listening on.
+        """
+        return self._server.getsockname()
+
+    def get_size(self) -> tuple:
+        size: tuple = self.backend.get_size()
+        if size != (self._screen._rows, self._screen._stride):
+            # Everyone needs the whole screen again after a resize.
+            self._screen = Surface(size[1], size[0])
+            self._ops.clear()
+            for client in self._clients:
+                client[2] = True
+        return size
+
+    def write(self, row: int, column: int, text: str, attr: int = 0):
+        _send(self.backend, row, column, text, attr)
+        self._screen.blit(text, column, row, attr=attr)
+        self._ops.append([row, column, _rle(text), attr] if attr else
+            [row, column, _rle(text)])
+
+    def scroll(self, row: int, column: int, height: int, width: int,
+            lines: int) -> bool:
+        if not self.backend.scroll(row, column, height, width, lines):
+            return False
+        self._screen.scroll_region(row, column, height, width, lines)
+        self._ops.append(["s", row, column, height, width, lines])
+        return True
+
+    def flush(self):
+        self.backend.flush()
+        delta: bytes = _frame_message({"d": self._ops}) if self._ops else None
+        self._ops = list()
+        self._publish(delta)
+
+    def poll(self):
+        # Viewers who connect while the screen isn't changing still need
+        # their keyframe.
+        self.backend.poll()
+        if self._ops:
+            self.flush()
+        else:
+            self._publish(None)
+
+    def _publish(self, delta: bytes):
+        # Send `delta` to every viewer, or a keyframe to those who need one.
+        self._accept()
+        keyframe: bytes = None
+        for client in list(self._clients):
+            if client[2]:
+                if keyframe is None:
+                    keyframe = self._keyframe()
+                client[1].append(keyframe)
+                client[2] = False
+            elif delta is not None:
+                client[1].append(delta)
+            self._send(client)
+
+    def _keyframe(self) -> bytes:
+        screen: Surface = self._screen
+        return _frame_message({"k": [screen._rows, screen._stride], "d": [
+            [row, column, _rle(text), attr] if attr else [row, column, _rle(text)]
+            for row in range(screen._rows)
+            for column, text, attr in screen.get_runs(row)]})
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self._server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            connection.setblocking(False)
+            # Socket, queued messages, and whether it needs a keyframe.
+            self._clients.append([connection, deque(), True])
+
+    def _send(self, client: list):
+        connection, messages = client[0], client[1]
+        try:
+            while messages:
+                sent: int = connection.send(messages[0])
+                if sent < len(messages[0]):
+                    messages[0] = messages[0][sent:]
+                    break
+                messages.popleft()
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            connection.close()
+            self._clients.remove(client)
+            return
+
+        # Skip a slow viewer ahead to a keyframe, but finish any message
+        # which has already been partly sent.
+        if sum(len(message) for message in messages) > self.limit:
+            first: bytes = messages[0]
+            messages.clear()
+            messages.append(first)
+            client[2] = True
+
+    def getch(self) -> int:
+        return self.backend.getch()
+
+    def poll_key(self) -> int:
+        return self.backend.poll_key()
+
+    def fileno(self) -> int:
+        return self.backend.fileno()
+
+    def getstr(self, row: int, column: int, max_length: int) -> str:
+        return self.backend.getstr(row, column, max_length)
+
+    def set_regions(self, regions: list):
+        self.backend.set_regions(regions)
+
+    def close(self):
+        for client in self._clients:
+            client[0].close()
+        self._server.close()
+        self.backend.close()
+
+class StreamViewer(object):
+    """ Display a screen published by a `Broadcaster`.\n
+    Frames are drawn to `backend`, which defaults to curses. Call `run()` to
+    show frames until the stream ends.
+    """
+    backend: Backend
+    frames: int = 0
+    _connection: socket.socket
+    _screen: Surface
+
+    def __init__(self, address, backend: Backend = None):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self._connection = socket.socket(family, socket.SOCK_STREAM)
+        self._connection.connect(address)
+        self.backend = CursesBackend() if backend is None else backend
+        self._screen = Surface(0, 0)
+
+    def run(self):
+        """ Display frames until the broadcaster goes away.
+        """
+        try:
+            while self.update():
+                pass
+        finally:
+            self._connection.close()
+
+    def update(self) -> bool:
+        """ Wait for and display a single frame. Returns False once the stream
+        has ended.
+        """
+        header: bytes = self._read(4)
+        if header is None:
+            return False
+        message: bytes = self._read(struct.unpack("!I", header)[0])
+        if message is None:
+            return False
+        self.apply(json.loads(message.decode("utf-8")))
+        return True
+
+    def apply(self, message: dict):
+        """ Draw a single decoded message.
+        """
+        height, width = self.backend.get_size()
+        if "k" in message:
+            self._screen = Surface(message["k"][1], message["k"][0])
+
+        for op in message["d"]:
+            if op[0] == "s":
+                row, column, rows, columns, lines = op[1:]
+                self._screen.scroll_region(row, column, rows, columns, lines)
+                if self.backend.scroll(row, column, rows, columns, lines):
+                    continue
+                # Redraw the scrolled area if the terminal can't scroll it.
+                for line in range(row, row + rows):
+                    for left, text, attr in self._screen.get_runs(line,
+                            column, column + columns):
+                        self._write(line, left, text, attr, height, width)
+            else:
+                text: str = _unrle(op[2])
+                attr: int = op[3] if len(op) > 3 else 0
+                self._screen.blit(text, op[1], op[0], attr=attr)
+                self._write(op[0], op[1], text, attr, height, width)
+        self.backend.flush()
+        self.frames += 1
+
+    def _write(self, row: int, column: int, text: str, attr: int, height: int,
+            width: int):
+        # Clip to the viewer's terminal, leaving the last row alone like
+        # `FrameBuffer.render()` does.
+        if row >= height - 1 or column >= width:
+            return
+        _send(self.backend, row, column, fit_width(text, width - column, ""), attr)
+
+    def _read(self, count: int) -> bytes:
+        data: bytes = b""
+        while len(data) < count:
+            chunk: bytes = self._connection.recv(count - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+class Profiler(object):
+    """ Collect timings for each frame and each element.\n
+    Set a framebuffer's `profiler` to start collecting. Every element drawn
+    records its number of renders, its wall time both including and excluding
+    its children, and the number of blits and cells it wrote. Each frame
+    records its total time and the time spent sending output, both as
+    histograms. Read the results with `stats()`, or set `overlay` to draw a
+    summary in the top right corner of the screen.\n
+    Elements are only referenced weakly, so an element's record is dropped
+    once the program lets go of the element.
+    """
+    # Upper bounds of the histogram buckets, in milliseconds.
+    BUCKETS: tuple = (0.5, 1, 2, 4, 8, 16, 33, 66, float("inf"))
+
+    overlay: bool
+    frames: int = 0
+    elements: weakref.WeakKeyDictionary
+    frame_time: list
+    io_time: list
+    _stack: list
+    _current: list = None
+
+    def __init__(self, overlay: bool = False):
+        self.overlay = overlay
+        self.reset()
+
+    def reset(self):
+        """ Throw away everything recorded so far.
+        """
+        self.frames = 0
+        self.elements = weakref.WeakKeyDictionary()
+        self.frame_time = [0] * len(self.BUCKETS)
+        self.io_time = [0] * len(self.BUCKETS)
+        self._stack = list()
+        self._current = None
+
+    def enter(self, elem):
+        """ Called before `elem` is drawn.
+        """
+        record: list = self.elements.get(elem)
+        if record is None:
+            # Renders, seconds, seconds excluding children, blits and cells.
+            record = self.elements[elem] = [0, 0.0, 0.0, 0, 0]
+        self._stack.append([self._current, time.perf_counter(), 0.0])
+        self._current = record
+
+    def leave(self, elem):
+        """ Called after `elem` has been drawn.
+        """
+        record: list = self._current
+        self._current, start, children = self._stack.pop()
+        elapsed: float = time.perf_counter() - start
+        record[0] += 1
+        record[1] += elapsed
+        record[2] += elapsed - children
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def blit(self):
+        if self._current is not None:
+            self._current[3] += 1
+
+    def cells(self, count: int):
+        if self._current is not None:
+            self._current[4] += count
+
+    def frame(self, frame_time: float, io_time: float):
+        """ Called after each frame, with the times in seconds.
+        """
+        self.frames += 1
+        self.frame_time[bisect.bisect_left(self.BUCKETS, frame_time * 1000)] += 1
+        self.io_time[bisect.bisect_left(self.BUCKETS, io_time * 1000)] += 1
+
+    def stats(self) -> dict:
+        """ Return everything recorded so far.\n
+        Elements are listed from the most to the least time spent in the
+        element itself (`self_time`), and each histogram maps the upper bound
+        of a bucket in milliseconds to a count.
+        """
+        return {
+            "frames": self.frames,
+            "frame_time": dict(zip(self.BUCKETS, self.frame_time)),
+            "io_time": dict(zip(self.BUCKETS, self.io_time)),
+            "elements": [{
+                "element": elem,
+                "name": type(elem).__name__,
+                "renders": record[0],
+                "time": record[1],
+                "self_time": record[2],
+                "blits": record[3],
+                "cells": record[4],
+            } for elem, record in sorted(self.elements.items(),
+                key=lambda item: item[1][2], reverse=True)],
+        }
+
+    def summary(self, count: int = 3) -> list:
+        """ Return a few lines describing the slowest elements.
+        """
+        lines: list = [f"{self.frames} frames"]
+        for entry in self.stats()["elements"][:count]:
+            average: float = entry["self_time"] / max(entry["renders"], 1) * 1000
+            lines.append(f"{entry['name']} {average:.2f}ms {entry['blits']} blits")
+        return lines
+
+class FrameBuffer(Surface):
     """ Central framebuffer object.\n
     This handles stdin and stdout for the user, maintaining a text-based frame
     buffer of a given width and height. It supports primative drawing functions
@@ -13,73 +1459,182 @@ class FrameBuffer(object):
     Elements can be added to the framebuffer using `add_elem()`. Elements can
     contain a `render()` function which will be excuted each time the frame
     buffer is rendered. This can be used for things such as text boxes or
-    graphical windows.
+    graphical windows.\n
+    All input and output goes through a `Backend`. Framebuffers created
+    without one call `default_backend`, which is curses unless it has been
+    replaced (for example to record or replay a whole program). Pass a
+    `MemoryBackend` to run without a terminal.\n
+    Keys which are already waiting are read all at once, and the framebuffer
+    is only rendered when they have all been handled. `dispatch()` sends a
+    key to the framebuffer's `keymap`, and then to the `focus` element.\n
+    The size of the terminal is only read when it changes. `curses.KEY_RESIZE`
+    is handled by `getch()` rather than returned: once no more resizes have
+    arrived for `resize_delay` seconds, the framebuffer is reallocated by
+    `resize()`, and the next render lays everything out and redraws it once.\n
+    The framebuffer is the parent of the elements added to it, and `find()`
+    looks elements up by their path of names.
     """
-    # All ncurses access should be encapsulated through this class.
+    # All terminal access should be encapsulated through the backend.
 
-    elements: list = []
+    layout_changed: list
     volatile: bool = False
-    _window = None
-    _buffer: list
+    resize_delay: float = 0.05
+    cells_written: int = 0
+    rows_written: int = 0
+    backend: Backend = None
+    default_backend = CursesBackend
+    keymap: KeyMap
+    focus = None
+    _typeahead: deque
+    _blank: array = None
+    _front: array = None
+    _front_attrs: array = None
+    _front_styled: bool = False
+    _scrolled: bool = False
+    _dirty: dict
+    _layout_key: tuple = None
+    _regions: list = []
+    _resize_at: float = None
+    _first = None
+    _last = None
+    _names: dict = None
+    _children: list = None
+    _layout_serial: int = 0
+    _change_serial: int = 0
 
-    def __init__(self):
-        self._window = curses.initscr()
-        self._window.keypad(True)
+    def __init__(self, backend: Backend = None):
+        self.backend = type(self).default_backend() if backend is None else backend
+        self.layout_changed = list()
+        self.keymap = KeyMap()
+        self._typeahead = deque()
         self.reset()
-        curses.start_color()
-        curses.noecho()
 
     def __del__(self):
-        curses.echo()
-        curses.endwin()
+        if self.backend is not None:
+            self.backend.close()
 
-    def add_elem(self, elem):
+    @property
+    def elements(self) -> list:
+        """ The elements which have been added, in drawing order.
+        """
+        if self._children is None:
+            self._children = list(_siblings(self._first))
+        return self._children
+
+    def add_elem(self, elem, before = None):
         """ Add an element to this framebuffer.\n
         Elements are rendering objects which have the ability to redraw upon
-        each render.
+        each render. An element which already has a parent is moved. Pass
+        `before` to insert it ahead of one of the other elements.
         """
-        self.elements.append(elem)
+        _link(self, elem, before)
 
-    def blit(self, blit: str, xpos: int, ypos: int, transparent: str = ""):
-        """ Place a rectangular graphic onto the framebuffer, overwriting anything
-        under it.\n
-        An optional transparency char can be provided which will be
-        ignored (leaving the underlying art the same)
+    def remove_elem(self, elem):
+        """ Delete an element.\n
         """
-        i = 0
-        x = 0
-        y = 0
+        _unlink(self, elem)
 
-        while len(blit) > i:
-            if blit[i] == "\n":
-                x = 0
-                y += 1
-            else:
-                if blit[i] != transparent:
-                    self._buffer[xpos + x + (ypos + y) * self.get_width()] =  blit[i]
-                x += 1
-            i += 1
+    def find(self, path: str):
+        """ Return the element at a path of names separated by "/", such as
+        `"fullscreen/vsplit/console"`. Raises `KeyError` if there is none.
+        """
+        return _find(self, path)
 
-    def remove_elem(self, elem):
-        """ Delete an element.\n
+    def invalidate_layout(self):
+        """ Recompute element geometry on the next render.\n
+        Call this after changing an element's size or position by hand.
         """
-        self.elements.remove(elem)
+        self._layout_serial += 1
 
     def getch(self) -> int:
         """ Return a single keyboard input.\n
+        The framebuffer is only rendered once every key which was already
+        waiting has been returned.
+        """
+        if not self._typeahead:
+            self.render()
+            self._read_keys(self.backend.getch())
+            while self._resize_at is not None:
+                # Wait for the terminal to settle on a size, keeping any keys
+                # which are typed in the meantime.
+                delay: float = self._resize_at + self.resize_delay - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    self._read_keys(self.backend.poll_key())
+                    continue
+                self.resize()
+                if not self._typeahead:
+                    self.render()
+                    self._read_keys(self.backend.getch())
+        return self._typeahead.popleft()
+
+    def _read_keys(self, key: int):
+        # Queue up `key` and any others which are waiting, setting aside
+        # resizes.
+        while key != -1:
+            if key == curses.KEY_RESIZE:
+                self.handle_resize()
+            else:
+                self._typeahead.append(key)
+            key = self.backend.poll_key()
+
+    def handle_resize(self):
+        """ Note that the terminal has changed size.\n
+        Only needed when reading input without `getch()`. The framebuffer
+        isn't rendered again until `resize_delay` seconds after the last call,
+        when `render()` calls `resize()`.
+        """
+        self._resize_at = time.monotonic()
+
+    def resize(self):
+        """ Reallocate the framebuffer to fit the terminal's current size,
+        keeping whatever was drawn where it still fits.\n
+        Everything is sent to the terminal again on the next render, since its
+        contents can't be relied on after a resize.
+        """
+        self._resize_at = None
+        height, width = self.backend.get_size()
+        if (width, height) != (self._stride, self._rows):
+            old: array = self._buffer
+            old_attrs: array = self._attrs
+            stride: int = self._stride
+            columns: int = min(width, stride)
+            self._blank = array(_CELL, " ") * (width * height)
+            self._buffer = array(_CELL, self._blank)
+            self._attrs = array(_ATTR, (0,)) * (width * height)
+            for row in range(min(height, self._rows)):
+                line: array = old[row * stride:row * stride + columns]
+                # Don't keep half of a double width character.
+                if 0 < columns < stride and old[row * stride + columns] == _WIDE:
+                    line[-1] = " "
+                self._buffer[row * width:row * width + columns] = line
+                self._attrs[row * width:row * width + columns] = \
+                    old_attrs[row * stride:row * stride + columns]
+            self._stride = width
+            self._rows = height
+        self._front = None
+        self._dirty = {row: [0, self._stride] for row in range(self._rows)}
+        # Windows need to be created again at the new size.
+        if self._regions:
+            self._regions = None
+
+    def dispatch(self, key: int) -> bool:
+        """ Send a key to `keymap`, and then to the focused element if it
+        wasn't bound. Returns False if nothing used the key.
         """
-        self.render()
-        return self._window.getch()
+        if self.keymap.dispatch(key, self):
+            return True
+        return self.focus is not None and self.focus.handle_key(key)
 
     def get_width(self) -> int:
-        """ Return the width of the terminal.
+        """ Return the width of the terminal, as of the last resize.
         """
-        return self._window.getmaxyx()[1]
+        return self._stride
 
     def get_height(self) -> int:
-        """ Return the width of the terminal.
+        """ Return the height of the terminal, as of the last resize.
         """
-        return self._window.getmaxyx()[0]
+        return self._rows
 
     def input(self, column: int, row: int, max_length: int = 80):
         """ Allow the user to input a line of text.\n
@@ -87,47 +1642,340 @@ class FrameBuffer(object):
         input can appear anywhere on the screen. An optional max length can be
         provided.
         """
+        # Use up any keys which were typed ahead before asking the terminal.
+        result: str = ""
+        while self._typeahead:
+            key: int = self._typeahead.popleft()
+            if key == curses.KEY_ENTER or key == ord("\n"):
+                return result
+            elif key in (curses.KEY_BACKSPACE, 127, 8):
+                result = result[:-1]
+            elif _is_text_key(key):
+                if len(result) < max_length:
+                    result += chr(key)
+            # Other special keys, such as the arrows, can't be typed into the
+            # line, so they are dropped.
+        # The typed text is only drawn for this one frame, so remember what it
+        # covers.
+        inside: bool = 0 <= row < self._rows
+        start: int = row * self._stride
+        left: int = min(max(column, 0), self._stride)
+        right: int = min(max(column + len(result), 0), self._stride)
+        cells: array = self._buffer[start + left:start + right]
+        attrs: array = self._attrs[start + left:start + right]
+        if result:
+            self.blit(result, column, row)
+
         self.render()
-        curses.echo()
-        result: str = self._window.getstr(row, column, max_length).decode("utf-8")
-        curses.noecho()
-        return result
+        try:
+            return result + self.backend.getstr(row, column + len(result),
+                max_length - len(result))
+        finally:
+            if inside:
+                if right > left:
+                    self._buffer[start + left:start + right] = cells
+                    self._attrs[start + left:start + right] = attrs
+                # The backend echoed the line straight onto the terminal,
+                # which the previous frame knows nothing about, so the whole
+                # line has to be repainted by the next render.
+                right = min(max(column + max_length, 0), self._stride)
+                if self._front is not None and right > left:
+                    self._front[start + left:start + right] = \
+                        array(_CELL, "\0") * (right - left)
+                    self._damage(row, left, right)
 
     def render(self):
         """ Draw all screen elements and display to the terminal.\n
         This function is automatically called by input functions such as
-        `text_input` and `getch`.
+        `text_input` and `getch`. Only the spans which differ from the previous
+        frame are sent to the terminal, and `cells_written` and `rows_written`
+        report how much was sent.
         """
 
+        if self._resize_at is not None:
+            # Wait until the terminal has stopped changing size.
+            if time.monotonic() - self._resize_at < self.resize_delay:
+                return
+            self.resize()
+
+        if self.profiler is not None:
+            frame_start: float = time.perf_counter()
+
         if self.volatile:
             self.reset()
 
+        self.layout()
         for i in self.elements:
-            i._render(self)
+            i._draw(self)
+
+        if self.profiler is not None:
+            if self.profiler.overlay:
+                lines: list = self.profiler.summary()
+                width: int = max(len(line) for line in lines)
+                self.blit("\n".join(line.ljust(width) for line in lines),
+                    self._stride - width, 0)
+            io_start: float = time.perf_counter()
+
+        self.cells_written = 0
+        self.rows_written = 0
+        width: int = self._stride
+
+        # The previous frame is only useful if it still matches the buffer.
+        if self._front is None or len(self._front) != len(self._buffer):
+            self._front = array(_CELL, "\0") * len(self._buffer)
+            self._front_attrs = array(_ATTR, (0,)) * len(self._buffer)
+            self._front_styled = False
+            self._dirty = {row: [0, width] for row in range(self._rows)}
+
+        # Attributes only need comparing if some have been drawn, either in
+        # this frame or one which is still on the terminal.
+        styled: bool = self._styled or self._front_styled
+        attrs: array = None
+
+        for row, (left, right) in self._dirty.items():
+            if row >= self._rows - 1:
+                continue
+            start: int = row * width
+            if left > 0 and self._buffer[start + left] == _WIDE:
+                left -= 1
+            new: str = self._buffer[start + left:start + right].tounicode()
+            old: str = self._front[start + left:start + right].tounicode()
+            if styled:
+                attrs = self._attrs[start + left:start + right]
+                old_attrs: array = self._front_attrs[start + left:start + right]
+
+            # Shrink the damaged span down to the cells which actually differ
+            # from what is already on the terminal.
+            if not styled or attrs == old_attrs:
+                if new == old:
+                    continue
+                head, tail = _diff_span(new, old)
+                compare: tuple = ()
+            else:
+                head, tail = _diff_span(attrs, old_attrs)
+                if new != old:
+                    text_head, text_tail = _diff_span(new, old)
+                    head = min(head, text_head)
+                    tail = min(tail, text_tail)
+                compare = (attrs[head:len(attrs) - tail],
+                    old_attrs[head:len(old_attrs) - tail])
+            self._front[start + left + head:start + right - tail] = \
+                self._buffer[start + left + head:start + right - tail]
+            if styled:
+                self._front_attrs[start + left + head:start + right - tail] = \
+                    attrs[head:len(attrs) - tail]
+
+            # Long stretches of unchanged cells are skipped over rather than
+            # being sent again.
+            for first, last in _changed_runs(new[head:len(new) - tail],
+                    old[head:len(old) - tail], 8, *compare):
+                first += head
+                last += head
+                # Always start from the first half of a double width
+                # character.
+                if new[first] == _WIDE:
+                    first -= 1
+                if not styled:
+                    self.backend.write(row, left + first,
+                        new[first:last].replace(_WIDE, ""))
+                else:
+                    # Each run of cells which share an attribute is one write.
+                    for begin, end, attr in _attr_runs(new[first:last],
+                            attrs[first:last]):
+                        _send(self.backend, row, left + first + begin,
+                            new[first + begin:first + end].replace(_WIDE, ""), attr)
+                self.cells_written += last - first
+            self.rows_written += 1
+        self._dirty = {}
+        self._front_styled = self._styled
+
+        # Nothing changed, so there's no need to touch the terminal at all. A
+        # scroll still has to be sent, even if no rows were written after it.
+        if self.rows_written or self._scrolled:
+            self.backend.flush()
+            self._scrolled = False
+        self.backend.poll()
+
+        if self.profiler is not None:
+            end: float = time.perf_counter()
+            self.profiler.frame(end - frame_start, end - io_start)
 
+    def scroll_region(self, row: int, column: int, height: int, width: int,
+            lines: int):
+        """ Scroll a rectangle of the terminal up by `lines`.\n
+        If the backend can scroll the terminal, the rows already on screen are
+        moved instead of being sent again, so the next `render()` only sends
+        the new rows. The framebuffer's own contents aren't changed, so the
+        caller should still draw the whole rectangle.
+        """
+        if self._front is None or lines <= 0 or lines >= height:
+            return
+        if row < 0 or column < 0 or row + height > self._rows - 1 \
+                or column + width > self._stride:
+            return
+        if not self.backend.scroll(row, column, height, width, lines):
+            return
+        self._scrolled = True
+        _shift_rect(self._front, self._stride, row, column, height, width, lines)
+        if self._front_styled:
+            _shift_rect(self._front_attrs, self._stride, row, column, height,
+                width, lines, 0)
+        for line in range(row, row + height):
+            self._damage(line, column, column + width)
 
-        for i in range(self.get_height() - 1):
-            result: str = ""
+    def layout(self) -> list:
+        """ Position every element to fit the framebuffer.\n
+        The layout is only recomputed when the framebuffer's size or its
+        element tree has changed since the last call. Returns (and stores in
+        `layout_changed`) the elements whose geometry changed.
+        """
+        key: tuple = (self._stride, self._rows, self._layout_serial, _layout_serial)
+        if key == self._layout_key:
+            self.layout_changed = []
+            return self.layout_changed
 
-            for char in self._buffer[i * self.get_width():(i + 1) * self.get_width()]:
-                result += char
+        changed: list = list()
+        for i in self.elements:
+            i._layout(self, changed)
+        self._layout_key = key
+        self.layout_changed = changed
+        # A cached container only checks its own size, so let it know when
+        # anything inside it has moved.
+        for elem in changed:
+            elem.mark_dirty()
 
-            self._window.addstr(i, 0, result)
-        self._window.refresh()
+        # New windows start out blank, so everything has to be sent again.
+        regions: list = [(elem.anch_y, elem.anch_x, elem.height, elem.width)
+            for elem in walk_tree(self.elements) if elem.own_window]
+        if regions != self._regions:
+            self._regions = regions
+            self.backend.set_regions(regions)
+            self._front = None
+        return changed
 
     def reset(self):
         """ Reset the drawing area.\n
         Recreates the framebuffer, adjusting to fit the terminal's current size.
         """
-        self._buffer = list(" " * self.get_width() * self.get_height())
+        self._resize_at = None
+        self._rows, self._stride = self.backend.get_size()
+        if self._blank is None or len(self._blank) != self._stride * self._rows:
+            self._blank = array(_CELL, " ") * (self._stride * self._rows)
+        self._buffer = array(_CELL, self._blank)
+        self._attrs = array(_ATTR, (0,)) * len(self._blank)
+        self._styled = False
+        self._dirty = {row: [0, self._stride] for row in range(self._rows)}
+
+    def _damage(self, row: int, left: int, right: int):
+        """ Mark the cells from `left` up to `right` on `row` as changed.\n
+        Only damaged spans are compared against the previous frame by
+        `render()`.
+        """
+        span = self._dirty.get(row)
+        if span is None:
+            self._dirty[row] = [left, right]
+        else:
+            if left < span[0]:
+                span[0] = left
+            if right > span[1]:
+                span[1] = right
 
 class FBElement(object):
     """ Base class for Frame Buffer Elements.\n
+    Set `cached` to keep the element's output between frames (see `_draw()`),
+    or `own_window` to give it a separate region of the terminal which is
+    refreshed independently, where the backend supports it.\n
+    Elements know their `parent` (a container or framebuffer) and their
+    siblings, so they can be moved around the tree in constant time.\n
+    A framebuffer is only referenced weakly by its elements, so that it is
+    still closed as soon as the program lets go of it.\n
+    Elements keep their geometry, settings, tree links and cache in
+    `__slots__`, and every element in this module declares `__slots__`, so
+    none of them has a `__dict__`. Subclasses which don't declare
+    `__slots__` get a `__dict__` as usual, and may give `cached` and the
+    other fields new defaults with class attributes.
     """
-    anch_x: int = 0
-    anch_y: int = 0
-    width: int = 0
-    height: int = 0
+    __slots__ = ("anch_x", "anch_y", "width", "height", "cached", "own_window",
+        "_parent", "_name", "_prev", "_next", "_surface", "_surface_key",
+        "__weakref__")
+    # The default of each slot, set on every new element by `__new__()`.
+    _defaults: tuple = (("anch_x", 0), ("anch_y", 0), ("width", 0), ("height", 0),
+        ("cached", False), ("own_window", False), ("_parent", None), ("_name", None),
+        ("_prev", None), ("_next", None), ("_surface", None), ("_surface_key", None))
+    # Slots which a subclass has replaced with class attributes.
+    _shadowed: frozenset = frozenset()
+
+    anch_x: int
+    anch_y: int
+    width: int
+    height: int
+    cached: bool
+    own_window: bool
+    keymap: KeyMap = None
+    _surface: Sprite
+    _surface_key: tuple
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._shadowed = frozenset(name for name, value in FBElement._defaults
+            if getattr(cls, name) is not FBElement.__dict__[name])
+
+    def __new__(cls, *args, **kwargs):
+        self = object.__new__(cls)
+        if cls._shadowed:
+            # Leave the subclass's own class attributes showing through.
+            for name, value in FBElement._defaults:
+                if name not in cls._shadowed:
+                    setattr(self, name, value)
+            return self
+        self.anch_x = self.anch_y = self.width = self.height = 0
+        self.cached = self.own_window = False
+        self._parent = self._name = self._prev = self._next = None
+        self._surface = self._surface_key = None
+        return self
+
+    @property
+    def parent(self):
+        """ The container or framebuffer this element was added to.
+        """
+        parent = self._parent
+        return parent() if type(parent) is weakref.ref else parent
+
+    @property
+    def name(self) -> str:
+        """ The element's name, used by `find()`. Set by `read_tree()`.
+        """
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        parent = self.parent
+        if parent is None:
+            self._name = name
+            return
+        if parent._names is not None and parent._names.get(self._name) is self:
+            del parent._names[self._name]
+        self._name = name
+        _index_name(parent, self)
+
+    def get_path(self) -> str:
+        """ Return the names from the top of the tree down to this element,
+        separated by "/".
+        """
+        names: list = list()
+        elem = self
+        while isinstance(elem, FBElement):
+            names.append(str(elem._name))
+            elem = elem.parent
+        return "/".join(reversed(names))
+
+    @property
+    def next_sibling(self):
+        return self._next
+
+    @property
+    def prev_sibling(self):
+        return self._prev
 
     def get_top(self) -> int:
         return self.anch_y
@@ -141,127 +1989,334 @@ class FBElement(object):
     def get_right(self) -> int:
         return self.anch_x + self.width
 
-    def _render(self, parent: FrameBuffer):
+    def detach(self):
+        """ Remove this element from its parent, if it has one.
+        """
+        if self.parent is not None:
+            _unlink(self.parent, self)
+
+    def handle_key(self, key: int) -> bool:
+        """ Respond to a key while this element has focus, returning False if
+        it wasn't used.\n
+        By default keys are looked up in `keymap`, and the bound action is
+        called with the element.
+        """
+        return self.keymap is not None and self.keymap.dispatch(key, self)
+
+    def mark_dirty(self):
+        """ Let a cached element know that it needs to be rendered again.\n
+        Only needed when `cached` is set, on the element or any of its
+        ancestors. Changes to the element's size are picked up automatically.
+        """
+        elem = self
+        while isinstance(elem, FBElement):
+            elem._surface_key = None
+            elem = elem.parent
+        if elem is not None:
+            elem._change_serial += 1
+
+    def invalidate(self):
+        """ Render this element and everything below it from scratch on the
+        next frame, and lay the tree out again.
+        """
+        for elem in walk_tree((self,)):
+            elem._surface_key = None
+        self.mark_dirty()
+        _layout_changed(self)
+
+    def _draw(self, parent: Surface):
+        """ Render this element onto `parent`.\n
+        If `cached` is set the element renders into an off-screen surface,
+        which is then copied onto `parent` each frame until `mark_dirty()` is
+        called. Cells which the element did not draw stay transparent, and
+        anything drawn outside of the element's area is clipped.
+        """
+        profiler: Profiler = parent.profiler
+        if profiler is not None:
+            profiler.enter(self)
+            self._paint(parent)
+            profiler.leave(self)
+        else:
+            self._paint(parent)
+
+    def _paint(self, parent: Surface):
+        if not self.cached:
+            self._render(parent)
+            return
+
+        key: tuple = (self.width, self.height)
+        if self._surface_key != key:
+            surface = Surface(self.width, self.height, "\0")
+            surface.origin_x = self.anch_x
+            surface.origin_y = self.anch_y
+            surface.profiler = parent.profiler
+            self._render(surface)
+            self._surface = surface.to_sprite("\0")
+            self._surface_key = key
+        parent.blit(self._surface, self.anch_x, self.anch_y)
+
+    def _layout(self, parent: FrameBuffer, changed: list):
+        return
+
+    def _render(self, parent: Surface):
         return
 
 class FBContainer(FBElement):
     """ Base class for maintaining child elements.\n
+    Containers position their children in `_layout()`, which the framebuffer
+    only runs when the terminal size or the element tree changes.\n
+    Children are kept in a linked list, so adding, removing and moving them
+    takes constant time however many there are. Named children can be looked
+    up with `find()`.
     """
-    children: list
+    __slots__ = ("_first", "_last", "_names", "_children")
 
     def __init__(self):
-        self.children = list()
+        self._first = None
+        self._last = None
+        self._names = None
+        self._children = None
 
-    def add_child(self, child: FBElement):
-        self.children.append(child)
+    @property
+    def children(self) -> list:
+        """ The container's children, in order.\n
+        This is rebuilt after the children change, so it should not be
+        modified directly.
+        """
+        if self._children is None:
+            self._children = list(_siblings(self._first))
+        return self._children
+
+    @children.setter
+    def children(self, children: list):
+        while self._first is not None:
+            _unlink(self, self._first)
+        for child in children:
+            _link(self, child, None)
+
+    def add_child(self, child: FBElement, before: FBElement = None):
+        """ Add a child, or move it here if it already has a parent. Pass
+        `before` to insert it ahead of an existing child.
+        """
+        _link(self, child, before)
 
     def remove_child(self, child: FBElement):
-        self.children.remove(child)
+        _unlink(self, child)
 
-    def _render(self, parent: FrameBuffer):
+    def find(self, path: str) -> FBElement:
+        """ Return the descendant at a path of names separated by "/". Raises
+        `KeyError` if there is none.
+        """
+        return _find(self, path)
+
+    def _layout(self, parent: FrameBuffer, changed: list):
+        for child in self.children:
+            child._layout(parent, changed)
+
+    def _render(self, parent: Surface):
         for child in self.children:
-            child._render(parent)
+            child._draw(parent)
 
 class FullScreen(FBContainer):
     """ Resize all child elements to match the size of the parent FrameBuffer.
     """
-    def _render(self, parent: FrameBuffer):
+    __slots__ = ()
+
+    def _layout(self, parent: FrameBuffer, changed: list):
         for child in self.children:
-            child.anch_x = 0
-            child.anch_y = 0
-            child.width = parent.get_width()
-            child.height = parent.get_height() - 1
-            child._render(parent)
+            _place(child, 0, 0, parent._stride, parent._rows - 1, changed)
+        super()._layout(parent, changed)
 
 class VSplit(FBContainer):
     """ Evenly split children vertically.
     """
-    def _render(self, parent):
-        for i in range(len(self.children)):
-            if self.children[i] == self:
-                continue
-            self.children[i].anch_x = self.anch_x + self.width // len(self.children) * i
-            self.children[i].anch_y = self.anch_y
-            self.children[i].width = self.width // len(self.children)
-            self.children[i].height = self.height
-            self.children[i]._render(parent)
+    __slots__ = ()
+
+    def _layout(self, parent: FrameBuffer, changed: list):
+        children: list = self.children
+        for i in range(len(children)):
+            width: int = self.width // len(children)
+            _place(children[i], self.anch_x + width * i, self.anch_y,
+                width, self.height, changed)
+        super()._layout(parent, changed)
 
 class HSplit(FBContainer):
     """ Evenly split children horizontally.
     """
-    def _render(self, parent):
-        for i in range(len(self.children)):
-            if self.children[i] == self:
-                continue
-            self.children[i].anch_x = self.anch_x
-            self.children[i].anch_y = self.anch_y + self.height // len(self.children) * i
-            self.children[i].width = self.width
-            self.children[i].height = self.height // len(self.children)
-            self.children[i]._render(parent)
+    __slots__ = ()
+
+    def _layout(self, parent: FrameBuffer, changed: list):
+        children: list = self.children
+        for i in range(len(children)):
+            height: int = self.height // len(children)
+            _place(children[i], self.anch_x, self.anch_y + height * i,
+                self.width, height, changed)
+        super()._layout(parent, changed)
 
 class Center(FBContainer):
     """ Center children without modifying their width.
     """
-    def _render(self, parent):
+    __slots__ = ()
+
+    def _layout(self, parent: FrameBuffer, changed: list):
         for child in self.children:
-            child.anch_x = (self.width - child.width) // 2
-            child.anch_y = (self.height - child.height) // 2
-            child._render(parent)
+            _place(child, (self.width - child.width) // 2,
+                (self.height - child.height) // 2, child.width, child.height,
+                changed)
+        super()._layout(parent, changed)
 
 class TextDisplay(FBElement):
     """ Maintain a list of text entries.\n
     Will display a block of text which can be added to by use of the `print()`
     function. This can be anchored somewhere on the framebuffer and will be
-    updated each redraw.
+    updated each redraw.\n
+    Only the most recent `history` lines are kept. Each line is word wrapped
+    once per width, when it first comes into view, so changing the width only
+    wraps the lines which are on screen. When there is more text than fits,
+    the newest lines are shown.
     """
+    __slots__ = ("back", "border", "fix_x", "fix_y", "margin", "history",
+        "_lines", "_partial", "_partial_rows", "_wrapped", "_wrap_width",
+        "_shown", "_shown_key", "_frame", "_frame_key")
+
     back: str
     border: str
-    buffer: str = ""
     fix_x: int
     fix_y: int
     margin: int
+    history: int
+    _lines: deque
+    _partial: str
+    _partial_rows: tuple
+    _wrapped: deque
+    _wrap_width: int
+    _shown: list
+    _shown_key: tuple
+    _frame: Sprite
+    _frame_key: tuple
 
-    def __init__(self, border: str = "#", back: str = " ", margin: int = 1):
+    def __init__(self, border: str = "#", back: str = " ", margin: int = 1,
+            history: int = 1000):
         self.back = back
         self.border = border
         self.margin = margin
+        self.history = history
+        self._lines = deque(maxlen=history)
+        self._partial = ""
+        self._partial_rows = None
+        self._wrapped = deque(maxlen=history)
+        self._wrap_width = None
+        self._shown = self._shown_key = None
+        self._frame = self._frame_key = None
+
+    @property
+    def buffer(self) -> str:
+        """ The text which has been printed to this display.
+        """
+        return "".join(line + "\n" for line in self._lines) + self._partial
+
+    @buffer.setter
+    def buffer(self, string: str):
+        self.clear()
+        self.print(string)
 
     def _render(self, parent: FrameBuffer):
-        parent.blit(add_border(create_rect(self.back, self.width - 2, self.height - 2),
-            self.border, self.back), self.anch_x, self.anch_y)
+        # The frame only needs to be rebuilt when its appearance changes.
+        key: tuple = (self.width, self.height, self.border, self.back)
+        if self._frame_key != key:
+            self._frame = Sprite(add_border(create_rect(self.back,
+                self.width - 2, self.height - 2), self.border, self.back))
+            self._frame_key = key
+        parent.blit(self._frame, self.anch_x, self.anch_y)
+
+        self._draw_rows(parent, self.visible_rows(self.width - 2 - self.margin,
+            self.height - 2), self.anch_x + 1, self.anch_y + 1,
+            self.anch_x, self.width)
+
+    def _draw_rows(self, parent: Surface, rows: list, x: int, y: int,
+            left: int, width: int):
+        """ Draw a list of rows from `visible_rows()`.\n
+        If the rows are the same as last time but moved up, the terminal is
+        scrolled first (over the columns from `left` to `left + width`), so
+        that only the new rows need to be sent.
+        """
+        key: tuple = (x, y, left, width, len(rows))
+        if key == self._shown_key and rows and self._shown:
+            shift: int = 0
+            for i in range(1, len(self._shown)):
+                if self._shown[i] is rows[0]:
+                    shift = i
+                    break
+            if shift and isinstance(parent, FrameBuffer):
+                parent.scroll_region(y, left, len(rows), width, shift)
+        self._shown = rows
+        self._shown_key = key
 
         y_off = 0
-        for i in self.buffer.splitlines():
-            x_off = 0
-            for i in i.split():
-                if x_off + len(i) > self.width - 2 - self.margin:
-                    y_off += 1
-                    x_off = 0
-                parent.blit(i, self.anch_x + 1 + x_off, self.anch_y + 1 + y_off)
-                x_off += len(i) + 1
+        for row in rows:
+            parent.blit(row, x, y + y_off)
             y_off += 1
 
+    def visible_rows(self, width: int, count: int) -> list:
+        """ Return up to `count` of the newest rows, wrapped to `width`.\n
+        Each row is a `Sprite` with its spaces left transparent.
+        """
+        if width != self._wrap_width:
+            # Lines are wrapped again as they are needed, newest first.
+            self._wrap_width = width
+            self._wrapped = deque([None] * len(self._lines), maxlen=self.history)
+            self._partial_rows = None
+        # The unfinished last line is kept wrapped until more is printed.
+        if self._partial_rows is None or self._partial_rows[0] is not self._partial:
+            self._partial_rows = (self._partial,
+                _wrap_line(self._partial, width) if self._partial else [])
+
+        result: list = list(self._partial_rows[1])
+        index: int = len(self._wrapped) - 1
+        while len(result) < count and index >= 0:
+            rows: list = self._wrapped[index]
+            if rows is None:
+                rows = self._wrapped[index] = _wrap_line(self._lines[index], width)
+            result[:0] = rows
+            index -= 1
+        return result[max(len(result) - count, 0):]
+
     def clear(self):
         """ Clear the text buffer.
         """
-        self.buffer = ""
+        self._lines.clear()
+        self._wrapped.clear()
+        self._partial = ""
+        self.mark_dirty()
 
     def print(self, string: str):
         """ Push a new line of text to the text field.
         """
-        self.buffer += string
+        lines: list = (self._partial + string).split("\n")
+        self._partial = lines.pop()
+        self._lines.extend(lines)
+        self._wrapped.extend([None] * len(lines))
+        self.mark_dirty()
 
 class SelectList(FBElement):
     """ Handle drawing a list of selectable options.
     """
+    __slots__ = ("background", "entries", "selected", "_curpos")
+
     background: str
     entries: int
     selected: str
-    _curpos: int = 0
+    keymap = KeyMap({
+        curses.KEY_UP: lambda self: self.movecur(-1),
+        curses.KEY_DOWN: lambda self: self.movecur(1),
+    })
+    _curpos: int
+
+    def __init__(self):
+        self._curpos = 0
 
     def _render(self, parent: FrameBuffer):
-        parent.blit(create_rect(self.background, 1, self.entries), self.anch_x,
-            self.anch_y)
+        parent.vline(self.background, self.anch_x, self.anch_y, self.entries)
         parent.blit(self.selected, self.anch_x, self.anch_y + self._curpos)
 
     @staticmethod
@@ -280,16 +2335,11 @@ class SelectList(FBElement):
         while (1):
             inchar: int = parent.getch()
 
-            if inchar == curses.KEY_UP:
-                self.movecur(-1)
-            elif inchar == curses.KEY_DOWN:
-                self.movecur(1)
-
             if inchar == curses.KEY_ENTER or inchar == ord('\n'):
                 break
+            self.handle_key(inchar)
         result: int = self._curpos
-        parent.blit(create_rect(self.background, 1, self.entries), self.anch_x,
-            self.anch_y)
+        parent.vline(self.background, self.anch_x, self.anch_y, self.entries)
         parent.remove_elem(self)
         return result
 
@@ -299,6 +2349,961 @@ class SelectList(FBElement):
         if not (self._curpos + pos < 0 or self._curpos + pos >= self.entries):
             self._curpos += pos
 
+class VirtualList(FBElement):
+    """ A scrolling list of selectable rows which only draws what is visible.\n
+    `items` can be any sequence, or a callable which takes `(start, stop)` and
+    returns the labels for those rows, in which case `count` must give the
+    number of rows (either as an int or a callable). Only the rows inside the
+    element's height are ever fetched, so the list can be arbitrarily long.\n
+    Besides the arrow keys, PageUp/PageDown/Home/End move the cursor, and
+    typing searches forwards for a row starting with the typed text.
+    """
+    __slots__ = ("items", "count", "selected", "background", "search",
+        "_curpos", "_top")
+
+    items: object
+    count: object
+    selected: str
+    background: str
+    search: str
+    keymap = KeyMap({
+        curses.KEY_UP: lambda self: self.movecur(-1),
+        curses.KEY_DOWN: lambda self: self.movecur(1),
+        curses.KEY_PPAGE: lambda self: self.movecur(-max(self.height, 1)),
+        curses.KEY_NPAGE: lambda self: self.movecur(max(self.height, 1)),
+        curses.KEY_HOME: lambda self: self.setcur(0),
+        curses.KEY_END: lambda self: self.setcur(self.get_count() - 1),
+        curses.KEY_BACKSPACE: lambda self: self.set_search(self.search[:-1]),
+        127: lambda self: self.set_search(self.search[:-1]),
+        8: lambda self: self.set_search(self.search[:-1]),
+        27: lambda self: self.set_search(""),
+    })
+    _curpos: int
+    _top: int
+
+    def __init__(self, items, count = None, selected: str = "#",
+            background: str = " "):
+        if callable(items) and count is None:
+            raise TypeError("A count is required when items is a callable.")
+        self.items = items
+        self.count = count
+        self.selected = selected
+        self.background = background
+        self.search = ""
+        self._curpos = 0
+        self._top = 0
+
+    def get_count(self) -> int:
+        """ Return the number of rows in the list.
+        """
+        if self.count is None:
+            return len(self.items)
+        return self.count() if callable(self.count) else self.count
+
+    def get_selection(self) -> int:
+        """ Return the index of the row under the cursor.
+        """
+        return self._curpos
+
+    def _fetch(self, start: int, stop: int) -> list:
+        if callable(self.items):
+            return list(self.items(start, stop))
+        return list(self.items[start:stop])
+
+    def _render(self, parent: Surface):
+        rows: int = max(self.height, 1)
+        # Scroll just far enough to keep the cursor on screen.
+        if self._curpos < self._top:
+            self._top = self._curpos
+        elif self._curpos >= self._top + rows:
+            self._top = self._curpos - rows + 1
+
+        width: int = self.width - str_width(self.selected)
+        labels: list = self._fetch(self._top, self._top + rows)
+        for i in range(rows):
+            label: str = str(labels[i]) if i < len(labels) else ""
+            marker: str = self.selected if self._top + i == self._curpos \
+                else self.background * str_width(self.selected)
+            parent.blit(marker + fit_width(label, width, self.background),
+                self.anch_x, self.anch_y + i)
+
+    def movecur(self, pos: int):
+        """ Move the selection cursor by `pos`, stopping at either end.
+        """
+        self.setcur(self._curpos + pos)
+
+    def setcur(self, index: int):
+        """ Move the selection cursor to `index`, stopping at either end.
+        """
+        self._curpos = max(min(index, self.get_count() - 1), 0)
+        self.mark_dirty()
+
+    def handle_key(self, key: int) -> bool:
+        # Anything printable which isn't bound is used for searching.
+        if super().handle_key(key):
+            return True
+        elif _is_text_key(key):
+            self.set_search(self.search + chr(key))
+            return True
+        return False
+
+    def set_search(self, search: str):
+        """ Change the type-to-search text, moving to the first match if it
+        isn't empty.
+        """
+        self.search = search
+        if search:
+            self.find(search)
+
+    def find(self, prefix: str, start: int = None) -> int:
+        """ Move the cursor to the first row at or after `start` (the cursor by
+        default) which starts with `prefix`, ignoring case.\n
+        The search wraps around, and rows are fetched a page at a time. Returns
+        the row found, or -1 if there is none.
+        """
+        prefix = prefix.casefold()
+        count: int = self.get_count()
+        start = self._curpos if start is None else start
+        chunk: int = max(self.height, 256)
+
+        # Search to the end of the list, then wrap around to the start.
+        for low, high in ((start, count), (0, min(start, count))):
+            for first in range(low, high, chunk):
+                labels: list = self._fetch(first, min(first + chunk, high))
+                for i in range(len(labels)):
+                    if str(labels[i]).casefold().startswith(prefix):
+                        self.setcur(first + i)
+                        return first + i
+        return -1
+
+    @staticmethod
+    def input(parent: FrameBuffer, anch_x: int, anch_y: int, width: int,
+            height: int, items, count = None, selected: str = "#",
+            background: str = " ") -> int:
+        """ Wait for the user to make a selection, returning its index.
+        """
+        self = VirtualList(items, count, selected, background)
+        self.anch_x = anch_x
+        self.anch_y = anch_y
+        self.width = width
+        self.height = height
+        parent.add_elem(self)
+
+        while True:
+            inchar: int = parent.getch()
+            if inchar == curses.KEY_ENTER or inchar == ord("\n"):
+                break
+            self.handle_key(inchar)
+        parent.fill_rect(background, anch_x, anch_y, width, height)
+        parent.remove_elem(self)
+        return self._curpos
+
+class LogView(FBElement):
+    """ Browse a log file of any size without loading it into memory.\n
+    The file is memory-mapped, and only the lines on screen are ever decoded.
+    Long lines are wrapped when they are drawn. While `follow` is set the view
+    sticks to the end of the file and shows new lines as they are appended.\n
+    A sparse index of line offsets, with one entry per `CHUNK` bytes, is built
+    in a background thread. It is only needed by `goto_line()`; scrolling
+    works by searching for newlines around the current position.
+    """
+    __slots__ = ("path", "follow", "indexed_lines", "_file", "_map", "_size",
+        "_index_size", "_generation", "_top", "_offsets", "_lines", "_indexer",
+        "_lock")
+    CHUNK: int = 1 << 20
+
+    path: str
+    follow: bool
+    indexed_lines: int
+    keymap = KeyMap({
+        curses.KEY_UP: lambda self: self.scroll(-1),
+        curses.KEY_DOWN: lambda self: self.scroll(1),
+        curses.KEY_PPAGE: lambda self: self.scroll(-max(self.height, 1)),
+        curses.KEY_NPAGE: lambda self: self.scroll(max(self.height, 1)),
+        curses.KEY_HOME: lambda self: self.goto_line(0),
+        curses.KEY_END: lambda self: self.end(),
+    })
+    _file: object
+    _map: mmap.mmap
+    _size: int
+    _index_size: int
+    _generation: int
+    _top: int
+    _offsets: array
+    _lines: array
+    _indexer: threading.Thread
+    _lock: threading.Lock
+
+    def __init__(self, path: str, follow: bool = True):
+        self.path = path
+        self.follow = follow
+        self.indexed_lines = 0
+        self._file = open(path, "rb")
+        self._map = None
+        self._size = self._index_size = self._generation = self._top = 0
+        self._offsets = array("q", [0])
+        self._lines = array("q", [0])
+        self._indexer = None
+        self._lock = threading.Lock()
+        self._remap()
+
+    def close(self):
+        """ Release the file.
+        """
+        self._map = None
+        self._file.close()
+
+    def _remap(self):
+        # Pick up appends to the file, starting over if it was truncated.
+        size: int = os.fstat(self._file.fileno()).st_size
+        if size != self._size:
+            if size < self._size:
+                with self._lock:
+                    self._offsets = array("q", [0])
+                    self._lines = array("q", [0])
+                    self.indexed_lines = 0
+                    self._generation += 1
+                self._top = 0
+                self._index_size = 0
+            self._size = size
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) \
+                if size else None
+            self.mark_dirty()
+
+        # Index anything which has been added since the indexer last ran.
+        if self._size > self._index_size and (self._indexer is None
+                or not self._indexer.is_alive()):
+            self._index_size = self._size
+            self._indexer = threading.Thread(target=self._index, args=(self._map,),
+                daemon=True)
+            self._indexer.start()
+
+    def _index(self, data: mmap.mmap):
+        # Record the offset and number of every line which starts a chunk.
+        # Only whole lines are indexed, so a partial last line is picked up
+        # again once it has been finished.
+        with self._lock:
+            pos: int = self._offsets[-1]
+            lines: int = self._lines[-1]
+            generation: int = self._generation
+        while pos < len(data):
+            end: int = data.rfind(b"\n", pos, min(pos + self.CHUNK, len(data)))
+            if end == -1:
+                end = data.find(b"\n", pos + self.CHUNK)
+                if end == -1:
+                    break
+            lines += data[pos:end + 1].count(b"\n")
+            pos = end + 1
+            with self._lock:
+                # The file was truncated, so this index is out of date.
+                if generation != self._generation:
+                    return
+                self._offsets.append(pos)
+                self._lines.append(lines)
+                self.indexed_lines = lines
+
+    def _line_at(self, pos: int) -> tuple:
+        # Return the start and end of the line containing `pos`.
+        start: int = self._map.rfind(b"\n", 0, pos) + 1
+        end: int = self._map.find(b"\n", pos)
+        return start, self._size if end == -1 else end
+
+    def _decode(self, start: int, end: int) -> str:
+        return self._map[start:end].decode("utf-8", "replace").expandtabs()
+
+    def _wrap(self, line: str) -> list:
+        return wrap_cells(line, max(self.width, 1))
+
+    def _visible(self) -> list:
+        rows: int = self.height
+        result: list = list()
+        if self._map is None or rows <= 0:
+            return result
+
+        if self.follow:
+            # Walk backwards from the end of the file until the view is full.
+            end: int = self._size
+            if self._map[end - 1:end] == b"\n":
+                end -= 1
+            while len(result) < rows and end >= 0:
+                start: int = self._map.rfind(b"\n", 0, end) + 1
+                result[:0] = self._wrap(self._decode(start, end))
+                self._top = start
+                end = start - 1
+            return result[max(len(result) - rows, 0):]
+
+        pos: int = self._top
+        while len(result) < rows and pos < self._size:
+            start, end = self._line_at(pos)
+            result += self._wrap(self._decode(start, end))
+            pos = end + 1
+        return result[:rows]
+
+    def _render(self, parent: Surface):
+        self._remap()
+        y_off = 0
+        for row in self._visible():
+            parent.blit(fit_width(row, self.width), self.anch_x, self.anch_y + y_off)
+            y_off += 1
+        parent.clear_rect(self.anch_x, self.anch_y + y_off, self.width,
+            self.height - y_off)
+
+    def scroll(self, lines: int):
+        """ Move the view by a number of lines. Scrolling past the end of the
+        file starts following it again.
+        """
+        if self._map is None:
+            return
+        pos: int = self._top
+        if lines < 0:
+            self.follow = False
+            for i in range(-lines):
+                if pos == 0:
+                    break
+                pos = self._map.rfind(b"\n", 0, pos - 1) + 1
+        else:
+            for i in range(lines):
+                end: int = self._map.find(b"\n", pos)
+                if end == -1 or end + 1 >= self._size:
+                    self.follow = True
+                    break
+                pos = end + 1
+        self._top = pos
+        self.mark_dirty()
+
+    def end(self):
+        """ Jump to the end of the file and follow it.
+        """
+        self.follow = True
+        self.mark_dirty()
+
+    def goto_line(self, line: int) -> bool:
+        """ Show the file from the start of line number `line` (counting from
+        0). Returns False if the index hasn't reached that line yet.
+        """
+        with self._lock:
+            if line > self.indexed_lines:
+                return False
+            i: int = bisect.bisect_right(self._lines, line) - 1
+            pos: int = self._offsets[i]
+            current: int = self._lines[i]
+        while current < line:
+            pos = self._map.find(b"\n", pos) + 1
+            current += 1
+        self._top = pos
+        self.follow = False
+        self.mark_dirty()
+        return True
+
+class AsyncDriver(object):
+    """ Drive a framebuffer from an asyncio event loop.\n
+    Keys are read in the background and handed out by the awaitable
+    `getch()` and `input_line()`. Rendering is done by a scheduler which
+    redraws at most `fps` times per second, and only when an element has been
+    marked dirty (for example by `TextDisplay.print()`) or `invalidate()` has
+    been called. Many updates within one tick are drawn by a single render.
+    Start it with `run()`:\n
+    `asyncio.run(AsyncDriver(framebuffer).run(main()))`
+    """
+    framebuffer: FrameBuffer
+    fps: float
+    renders: int = 0
+    _keys: asyncio.Queue = None
+    _pending: bool = True
+    _seen: tuple = None
+
+    def __init__(self, framebuffer: FrameBuffer, fps: float = 30):
+        self.framebuffer = framebuffer
+        self.fps = fps
+
+    async def run(self, main):
+        """ Run the coroutine `main` while reading input and rendering in the
+        background, returning its result.
+        """
+        loop = asyncio.get_running_loop()
+        self._keys = asyncio.Queue()
+        fileno: int = self.framebuffer.backend.fileno()
+        tasks: list = [loop.create_task(self._render_loop())]
+        if fileno is not None:
+            loop.add_reader(fileno, self._read_keys)
+
+        try:
+            return await main
+        finally:
+            if fileno is not None:
+                loop.remove_reader(fileno)
+            for task in tasks:
+                task.cancel()
+            # Show whatever happened on the last tick.
+            self.framebuffer.render()
+
+    def invalidate(self):
+        """ Request a render on the next tick.
+        """
+        self._pending = True
+
+    async def getch(self) -> int:
+        """ Wait for a single keyboard input.
+        """
+        self.invalidate()
+        return await self._keys.get()
+
+    async def input_line(self, column: int, row: int, max_length: int = 80) -> str:
+        """ Wait for the user to input a line of text.\n
+        The text is echoed at `column` and `row` as it is typed, and returned
+        when the user presses the enter key.
+        """
+        editor = _LineEdit()
+        editor.anch_x = column
+        editor.anch_y = row
+        self.framebuffer.add_elem(editor)
+        try:
+            while True:
+                key: int = await self.getch()
+                if key == curses.KEY_ENTER or key == ord("\n"):
+                    break
+                elif key in (curses.KEY_BACKSPACE, 127, 8):
+                    editor.text = editor.text[:-1]
+                elif _is_text_key(key) and len(editor.text) < max_length:
+                    editor.text += chr(key)
+                editor.mark_dirty()
+        finally:
+            self.framebuffer.remove_elem(editor)
+        return editor.text
+
+    def _read_keys(self):
+        backend: Backend = self.framebuffer.backend
+        key: int = backend.poll_key()
+        while key != -1:
+            if key == curses.KEY_RESIZE:
+                self.framebuffer.handle_resize()
+            else:
+                self._keys.put_nowait(key)
+            key = backend.poll_key()
+
+    async def _render_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start: float = loop.time()
+            # Input is also checked once per tick, for backends without a
+            # file descriptor and for resizes, which don't make one readable.
+            self._read_keys()
+            state: tuple = (self.framebuffer._change_serial,
+                self.framebuffer._layout_serial, _layout_serial)
+            if self._pending or state != self._seen \
+                    or self.framebuffer._resize_at is not None:
+                self._pending = False
+                self._seen = state
+                self.framebuffer.render()
+                self.renders += 1
+            await asyncio.sleep(max(1 / self.fps - (loop.time() - start), 0))
+
+class RenderThread(threading.Thread):
+    """ Render a framebuffer from a dedicated thread.\n
+    Other threads must not touch the framebuffer or its elements directly.
+    Instead they post updates with `print()` and `call()`, which only append
+    to a queue. The render thread drains every waiting update at once,
+    merges the text printed to each element, and renders at most `fps` times
+    per second.\n
+    Targets can be elements, or names looked up in `nodes` (as returned by
+    `read_tree()`). Names let other processes post updates through a
+    `multiprocessing.Queue` passed in as `updates`.
+    """
+    framebuffer: FrameBuffer
+    fps: float
+    nodes: dict
+    updates = None
+    renders: int = 0
+    _stopping: threading.Event
+
+    def __init__(self, framebuffer: FrameBuffer, fps: float = 30,
+            nodes: dict = None, updates = None):
+        super().__init__(daemon=True)
+        self.framebuffer = framebuffer
+        self.fps = fps
+        self.nodes = dict() if nodes is None else nodes
+        self.updates = queue.SimpleQueue() if updates is None else updates
+        self._stopping = threading.Event()
+
+    def print(self, target, string: str):
+        """ Print to a `TextDisplay` from any thread.
+        """
+        self.updates.put((target, string))
+
+    def call(self, func, *args):
+        """ Run `func(*args)` on the render thread, for updates which aren't
+        covered by `print()`.
+        """
+        self.updates.put((func, args))
+
+    def stop(self):
+        """ Apply any waiting updates, render one last time and wait for the
+        thread to finish.
+        """
+        self._stopping.set()
+        self.join()
+
+    def run(self):
+        interval: float = 1 / self.fps
+        while not self._stopping.is_set():
+            start: float = time.monotonic()
+            try:
+                first: tuple = self.updates.get(timeout=interval)
+            except queue.Empty:
+                continue
+            self._apply(first)
+            self.framebuffer.render()
+            self.renders += 1
+            time.sleep(max(interval - (time.monotonic() - start), 0))
+
+        self._apply(None)
+        self.framebuffer.render()
+
+    def _apply(self, first: tuple):
+        # Text for the same element is joined so that each one is only
+        # printed to once per batch. Calls flush the text before them to keep
+        # updates in order.
+        pending: dict = dict()
+        update: tuple = first
+        while True:
+            if update is not None:
+                target, value = update
+                if callable(target):
+                    self._flush(pending)
+                    target(*value)
+                else:
+                    pending.setdefault(target, []).append(value)
+            try:
+                update = self.updates.get_nowait()
+            except queue.Empty:
+                break
+        self._flush(pending)
+
+    def _flush(self, pending: dict):
+        for target, strings in pending.items():
+            elem = self.nodes[target] if isinstance(target, str) else target
+            elem.print("".join(strings))
+        pending.clear()
+
+class _LineEdit(FBElement):
+    """ Echo the text being typed into `AsyncDriver.input_line()`.
+    """
+    __slots__ = ("text",)
+
+    text: str
+
+    def __init__(self):
+        self.text = ""
+
+    def _render(self, parent: Surface):
+        parent.blit(self.text, self.anch_x, self.anch_y)
+
+# Bumped by `invalidate_layout()`. Each framebuffer also keeps its own serials
+# for changes to its tree and its elements, so that one framebuffer's changes
+# don't cause work for the others.
+_layout_serial: int = 0
+
+def invalidate_layout():
+    """ Force every framebuffer to recompute element geometry on its next
+    render.\n
+    Call this after changing an element's size or position by hand. To only
+    affect one framebuffer, call its `invalidate_layout()` instead.
+    """
+    global _layout_serial
+    _layout_serial += 1
+
+def _layout_changed(elem):
+    """ Let the framebuffer at the top of `elem`'s tree, if there is one,
+    know that it has to lay its elements out again.
+    """
+    while isinstance(elem, FBElement):
+        elem = elem.parent
+    if elem is not None:
+        elem._layout_serial += 1
+
+def walk_tree(elements: list):
+    """ Yield every element in a list of trees, parents before children.
+    """
+    for elem in elements:
+        yield elem
+        children = getattr(elem, "children", None)
+        if children:
+            yield from walk_tree(children)
+
+def _siblings(elem: FBElement):
+    """ Yield an element and each of the siblings after it.
+    """
+    while elem is not None:
+        yield elem
+        elem = elem._next
+
+def _link(owner, child: FBElement, before: FBElement):
+    """ Add `child` to a container or framebuffer, ahead of `before` or at the
+    end. The child is detached from its current parent first.
+    """
+    if before is not None and before.parent is not owner:
+        raise ValueError("Can only insert before a child of the same parent.")
+    element: bool = isinstance(owner, FBElement)
+    # Only a container can have the owner somewhere below it.
+    ancestor = owner if element and isinstance(child, FBContainer) else None
+    while ancestor is not None:
+        if ancestor is child:
+            raise ValueError("An element cannot be added to itself or its children.")
+        ancestor = ancestor._parent
+        if type(ancestor) is weakref.ref:
+            break
+    if owner is child:
+        raise ValueError("An element cannot be added to itself or its children.")
+    if child._parent is not None:
+        _unlink(child.parent, child)
+
+    if before is None:
+        child._prev = owner._last
+        if owner._last is None:
+            owner._first = child
+        else:
+            owner._last._next = child
+        owner._last = child
+    else:
+        child._prev = before._prev
+        child._next = before
+        if before._prev is None:
+            owner._first = child
+        else:
+            before._prev._next = child
+        before._prev = child
+    child._parent = owner if element else weakref.ref(owner)
+    _index_name(owner, child)
+    owner._children = None
+    if element:
+        owner.mark_dirty()
+    _layout_changed(owner)
+
+def _unlink(owner, child: FBElement):
+    """ Remove `child` from a container or framebuffer.
+    """
+    if child.parent is not owner:
+        raise ValueError("The element is not a child of this parent.")
+    if child._prev is None:
+        owner._first = child._next
+    else:
+        child._prev._next = child._next
+    if child._next is None:
+        owner._last = child._prev
+    else:
+        child._next._prev = child._prev
+    if owner._names is not None and owner._names.get(child._name) is child:
+        del owner._names[child._name]
+    child._parent = child._prev = child._next = None
+    owner._children = None
+    if isinstance(owner, FBElement):
+        owner.mark_dirty()
+    _layout_changed(owner)
+
+def _index_name(owner, child: FBElement):
+    """ Make a named child findable from its parent.
+    """
+    if child._name is None:
+        return
+    if owner._names is None:
+        owner._names = dict()
+    owner._names[child._name] = child
+
+def _find(owner, path: str) -> FBElement:
+    """ Follow a path of names separated by "/" down from `owner`.
+    """
+    elem = owner
+    for name in path.split("/"):
+        names: dict = getattr(elem, "_names", None)
+        if names is None or name not in names:
+            raise KeyError(path)
+        elem = names[name]
+    return elem
+
+def _place(elem: FBElement, anch_x: int, anch_y: int, width: int, height: int,
+        changed: list):
+    """ Move and resize an element, recording it in `changed` if its geometry
+    is different from before.
+    """
+    if (elem.anch_x, elem.anch_y, elem.width, elem.height) != (anch_x, anch_y, width, height):
+        elem.anch_x = anch_x
+        elem.anch_y = anch_y
+        elem.width = width
+        elem.height = height
+        changed.append(elem)
+
+def _is_text_key(key: int) -> bool:
+    """ Return whether a key is a printable character, rather than a control
+    character or one of curses' special keys.\n
+    Special keys are numbered from `curses.KEY_MIN` to `curses.KEY_MAX`, which
+    overlaps the code points of some characters, so those characters are
+    always treated as keys.
+    """
+    return 0 <= key < 0x110000 and not curses.KEY_MIN <= key <= curses.KEY_MAX \
+        and chr(key).isprintable()
+
+def _rle(text: str) -> list:
+    """ Run-length encode a string as a list of literal strings and
+    `[count, char]` pairs for runs of 4 or more.
+    """
+    result: list = list()
+    position: int = 0
+    for match in re.finditer(r"(.)\1{3,}", text, re.DOTALL):
+        if match.start() > position:
+            result.append(text[position:match.start()])
+        result.append([match.end() - match.start(), match.group(1)])
+        position = match.end()
+    if position < len(text):
+        result.append(text[position:])
+    return result
+
+def _unrle(runs: list) -> str:
+    """ Reverse `_rle()`.
+    """
+    return "".join(run if isinstance(run, str) else run[1] * run[0] for run in runs)
+
+def _frame_message(message: dict) -> bytes:
+    """ Encode a message for a `StreamViewer`.
+    """
+    payload: bytes = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return struct.pack("!I", len(payload)) + payload
+
+def _cursor_move(cursor: tuple, row: int, column: int) -> str:
+    """ Return the shortest escape sequence which moves the cursor from
+    `cursor` (or an unknown position if None) to `row` and `column`.
+    """
+    absolute: str = f"\x1b[{row + 1};{column + 1}H"
+    if cursor is None:
+        return absolute
+
+    moves: list = [absolute]
+    if cursor[0] == row:
+        if column == cursor[1]:
+            return ""
+        elif column > cursor[1]:
+            step: int = column - cursor[1]
+            moves.append("\x1b[C" if step == 1 else f"\x1b[{step}C")
+        else:
+            step: int = cursor[1] - column
+            moves.append("\x1b[D" if step == 1 else f"\x1b[{step}D")
+        if column == 0:
+            moves.append("\r")
+    elif row > cursor[0] and column == 0:
+        step: int = row - cursor[0]
+        moves.append("\r" + ("\x1b[B" if step == 1 else f"\x1b[{step}B"))
+    return min(moves, key=len)
+
+# A long row of each attribute which has been drawn with, to be sliced up
+# rather than building a new array for every run. Once there are `_ATTR_ROWS`
+# of them, the one `_attr_row()` returned least recently is dropped.
+_attr_rows: dict = dict()
+_ATTR_ROWS: int = 256
+
+def _attr_row(attr: int, length: int) -> array:
+    """ Return a row of at least `length` cells with the attribute `attr`.
+    """
+    attrs: array = _attr_rows.pop(attr, None)
+    if attrs is None or len(attrs) < length:
+        if len(_attr_rows) >= _ATTR_ROWS:
+            del _attr_rows[next(iter(_attr_rows))]
+        attrs = array(_ATTR, (attr,)) * max(length, 256)
+    _attr_rows[attr] = attrs
+    return attrs
+
+def _send(backend: Backend, row: int, column: int, text: str, attr: int):
+    """ Write to a backend, leaving out `attr` when it is the default.
+    """
+    if attr:
+        backend.write(row, column, text, attr)
+    else:
+        backend.write(row, column, text)
+
+def _sgr(attr: int) -> str:
+    """ Return the escape sequence which switches to `attr`.
+    """
+    fg, bg, flags = split_attr(attr)
+    codes: list = ["0"]
+    for flag, name, code in _FLAGS:
+        if flags & flag:
+            codes.append(str(code))
+    if fg != -1:
+        codes.append(str(30 + fg) if fg < 8 else str(82 + fg) if fg < 16 else f"38;5;{fg}")
+    if bg != -1:
+        codes.append(str(40 + bg) if bg < 8 else str(92 + bg) if bg < 16 else f"48;5;{bg}")
+    return f"\x1b[{';'.join(codes)}m"
+
+def _shift_rect(cells: array, stride: int, row: int, column: int, height: int,
+        width: int, lines: int, blank = " "):
+    """ Move the rows of a rectangle of cells up by `lines`, filling the rows
+    left at the bottom with `blank`.
+    """
+    for line in range(row, row + height):
+        start: int = line * stride + column
+        if line + lines < row + height:
+            cells[start:start + width] = cells[start + lines * stride:start + lines * stride + width]
+        else:
+            cells[start:start + width] = array(cells.typecode, (blank,)) * width
+
+def _attr_runs(cells: str, attrs: array) -> list:
+    """ Split a stretch of cells into the `(start, end, attr)` runs which
+    share an attribute. Double width characters are never split.
+    """
+    if not attrs:
+        return []
+    if attrs.count(attrs[0]) == len(attrs):
+        return [(0, len(attrs), attrs[0])]
+    runs: list = list()
+    begin: int = 0
+    for i in range(1, len(attrs)):
+        if attrs[i] != attrs[begin] and cells[i] != _WIDE:
+            runs.append((begin, i, attrs[begin]))
+            begin = i
+    runs.append((begin, len(attrs), attrs[begin]))
+    return runs
+
+def _changed_runs(new: str, old: str, gap: int = 8, new_attrs: array = None,
+        old_attrs: array = None) -> list:
+    """ Split two strings of equal length into the `(start, end)` runs which
+    differ, treating any aligned block of `gap` equal characters as a gap.
+    If attributes are given, blocks where they differ are included too.
+    """
+    runs: list = list()
+    begin: int = None
+    for i in range(0, len(new), gap):
+        if new[i:i + gap] == old[i:i + gap] and (new_attrs is None
+                or new_attrs[i:i + gap] == old_attrs[i:i + gap]):
+            if begin is not None:
+                runs.append((begin, i))
+                begin = None
+        elif begin is None:
+            begin = i
+    if begin is not None:
+        runs.append((begin, len(new)))
+    return runs
+
+def _diff_span(new: str, old: str) -> tuple:
+    """ Return the length of the common prefix and suffix of two strings of
+    equal length which are known to differ.\n
+    Both are found by bisection so that the comparisons stay in C.
+    """
+    low: int = 0
+    high: int = len(new)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if new[:mid] == old[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    head: int = low
+
+    low = 0
+    high = len(new) - head
+    while low < high:
+        mid = (low + high + 1) // 2
+        if new[len(new) - mid:] == old[len(old) - mid:]:
+            low = mid
+        else:
+            high = mid - 1
+    return head, low
+
+def _wrap_line(line: str, width: int) -> list:
+    """ Word wrap a single line of text to `width`, returning a list of
+    `Sprite` rows. An empty line produces a single empty row.
+    """
+    rows: list = list()
+    row: str = ""
+    for word in line.split():
+        if row and str_width(row) + 1 + str_width(word) > width:
+            rows.append(Sprite(row, " "))
+            row = ""
+        row = row + " " + word if row else word
+    rows.append(Sprite(row, " "))
+    return rows
+
+# Widths of every character, built 256 code points at a time as they are
+# needed.
+_width_blocks: dict = dict()
+
+def char_width(char: str) -> int:
+    """ Return the number of cells a character takes up on the terminal.\n
+    East Asian wide and full width characters take two cells, combining and
+    other zero width characters take none, and everything else takes one.
+    """
+    point: int = ord(char)
+    if point < 0x300:
+        return 1
+    block: bytes = _width_blocks.get(point >> 8)
+    if block is None:
+        block = _width_blocks[point >> 8] = bytes(_measure(chr(code))
+            for code in range(point & ~255, (point & ~255) + 256))
+    return block[point & 255]
+
+def _measure(char: str) -> int:
+    if unicodedata.combining(char) or unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0
+    if unicodedata.east_asian_width(char) in ("W", "F"):
+        return 2
+    return 1
+
+@functools.lru_cache(maxsize=4096)
+def str_width(string: str) -> int:
+    """ Return the number of cells a string takes up on the terminal.
+    """
+    if string.isascii():
+        return len(string)
+    return sum(char_width(char) for char in string)
+
+@functools.lru_cache(maxsize=4096)
+def to_cells(string: str) -> str:
+    """ Convert a string to one character per cell.\n
+    Double width characters are followed by a filler cell, and zero width
+    characters which can't be combined into the character before them are
+    dropped.
+    """
+    if string.isascii():
+        return string
+    result: list = list()
+    for char in unicodedata.normalize("NFC", string):
+        width: int = char_width(char)
+        if width == 2:
+            result.append(char + _WIDE)
+        elif width == 1:
+            result.append(char)
+    return "".join(result)
+
+def fit_width(string: str, width: int, fill: str = " ") -> str:
+    """ Cut a string down to `width` cells, and pad it out to `width` with
+    `fill` if it is shorter.
+    """
+    if string.isascii():
+        return string[:width].ljust(width, fill) if fill else string[:width]
+    cells: str = to_cells(string)[:width]
+    if cells and cells[-1] != _WIDE and char_width(cells[-1]) == 2:
+        # There isn't room for both halves of the last character.
+        cells = cells[:-1] + (fill or "")
+    cells = cells.replace(_WIDE, "")
+    return cells + fill * (width - str_width(cells)) if fill else cells
+
+def wrap_cells(string: str, width: int) -> list:
+    """ Break a string into rows of at most `width` cells, without splitting
+    double width characters.
+    """
+    if string.isascii():
+        return [string[i:i + width] for i in range(0, len(string), width)] or [""]
+    rows: list = list()
+    row: str = ""
+    used: int = 0
+    for char in string:
+        size: int = char_width(char)
+        if used + size > width and row:
+            rows.append(row)
+            row = ""
+            used = 0
+        row += char
+        used += size
+    rows.append(row)
+    return rows
+
 def add_border(string: str, border: str = " ", background: str = " ") -> str:
     """ Add a border around a string.\n
     This is a convienience function to draw a rectangular area around a string.
@@ -306,18 +3311,32 @@ def add_border(string: str, border: str = " ", background: str = " ") -> str:
     line_len = 0
 
     for i in string.split("\n"):
-        if len(i) > line_len:
-            line_len = len(i)
+        if str_width(i) > line_len:
+            line_len = str_width(i)
 
     result = border * (line_len + 2) + "\n"
 
     for i in string.split("\n"):
-        result += border + i + (line_len - len(i)) * background + border + "\n";
+        result += border + i + (line_len - str_width(i)) * background + border + "\n";
 
     result += border * (line_len + 2)
 
     return result
 
+def make_attr(fg: int = -1, bg: int = -1, flags: int = 0) -> int:
+    """ Combine colors and text attributes into a single cell attribute.\n
+    `fg` and `bg` are color numbers from 0 to 255, such as `curses.COLOR_RED`,
+    or -1 for the terminal's default. `flags` is any combination of `BOLD`,
+    `DIM`, `ITALIC`, `UNDERLINE`, `BLINK` and `REVERSE`. The default
+    attribute is 0.
+    """
+    return (fg + 1) | (bg + 1) << 9 | flags << 18
+
+def split_attr(attr: int) -> tuple:
+    """ Return the `(fg, bg, flags)` that make up an attribute.
+    """
+    return ((attr & 0x1ff) - 1, (attr >> 9 & 0x1ff) - 1, attr >> 18)
+
 def create_rect(string: str, width: int, height: int) -> str:
     """ Creates a rectangle which can be displayed to the frame buffer.\n
     """
@@ -327,7 +3346,8 @@ def read_tree(tree: dict) -> dict:
     """ Builds a tree structure using an input dict.\n
     This recursively scans through its input to build a tree which matches its
     visual input. Returns a dictionary of each element's name, pointing to each
-    element's class.
+    element's class. Each element's `name` is set, so the tree can also be
+    searched with `find()`.
     """
     result: dict = dict()
 
@@ -336,6 +3356,7 @@ def read_tree(tree: dict) -> dict:
             if not isinstance(tree[i][0], FBElement):
                 raise TypeError("The first member of a tuple must be a class instance.")
             result[i] = tree[i][0]
+            result[i].name = i
             if not isinstance(tree[i][1], dict):
                 raise TypeError("Expected a dict after class in tuple.")
             subtree: dict = read_tree(tree[i][1])
@@ -344,6 +3365,7 @@ def read_tree(tree: dict) -> dict:
                 result[i].add_child(subtree[j])
         elif isinstance(tree[i], FBElement):
             result[i] = tree[i]
+            result[i].name = i
         else:
             raise TypeError(f"Unexpected {tree[i]} in element tree.")
     return result
\ No newline at end of file